@@ -0,0 +1,34 @@
+"""Change feed triggers
+
+Revision ID: 3c7d9e2a5b18
+Revises: 9a4f61c3e8d2
+Create Date: 2026-10-19 14:26:51.803317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from uni_notify import (DROP_NOTIFY_FUNCTION_SQL, NOTIFY_FUNCTION_SQL,
+                        drop_trigger_sql, trigger_sql)
+
+
+# revision identifiers, used by Alembic.
+revision = '3c7d9e2a5b18'
+down_revision = '9a4f61c3e8d2'
+branch_labels = None
+depends_on = None
+
+TABLES = ('subjects', 'groups', 'teachers', 'students',
+          'teacher_subjects', 'student_subjects', 'grades')
+
+
+def upgrade() -> None:
+    op.execute(NOTIFY_FUNCTION_SQL)
+    for table in TABLES:
+        op.execute(trigger_sql(table))
+
+
+def downgrade() -> None:
+    for table in reversed(TABLES):
+        op.execute(drop_trigger_sql(table))
+    op.execute(DROP_NOTIFY_FUNCTION_SQL)
@@ -0,0 +1,26 @@
+"""Keyset pagination indexes
+
+Revision ID: 5e0c2b7d41a9
+Revises: b100c7a30238
+Create Date: 2026-10-19 10:12:40.118302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e0c2b7d41a9'
+down_revision = 'b100c7a30238'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('student_fullname_id', 'students', ['fullname', 'id'])
+    op.create_index('grade_date_of_id', 'grades', ['date_of', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('grade_date_of_id', table_name='grades')
+    op.drop_index('student_fullname_id', table_name='students')
@@ -0,0 +1,30 @@
+"""Grade search indexes
+
+Revision ID: 9a4f61c3e8d2
+Revises: 5e0c2b7d41a9
+Create Date: 2026-10-19 11:02:17.540921
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4f61c3e8d2'
+down_revision = '5e0c2b7d41a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('student_group_id', 'students', ['group_id'])
+    op.create_index('grade_student_date_of', 'grades', ['student_id', 'date_of'])
+    op.create_index('grade_subject_date_of', 'grades', ['subject_id', 'date_of'])
+    op.create_index('grade_teacher_date_of', 'grades', ['teacher_id', 'date_of'])
+
+
+def downgrade() -> None:
+    op.drop_index('grade_teacher_date_of', table_name='grades')
+    op.drop_index('grade_subject_date_of', table_name='grades')
+    op.drop_index('grade_student_date_of', table_name='grades')
+    op.drop_index('student_group_id', table_name='students')
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of result output: per-row awaited aiologger calls (as the scripts
+did before) against the batched ResultWriter. Both write to stdout, timings
+go to stderr (aiologger needs a pipe, not a regular file):
+
+    ./bench-output.py 1000000 | cat > /dev/null
+"""
+
+from __future__ import annotations
+
+import asyncio
+from aiologger import Logger
+from datetime import date
+import sys
+import time
+
+from uni_output import ResultWriter
+
+
+FMT = "%3d | %10s | %25s | %25s | %25s | %s"
+
+
+def fake_grades(num: int) -> list:
+    return [ (i, date(2023, 7, 1 + i % 28), "проф. Тарас Петренко",
+              "Шевченко, Оксана", "Квантова Алхімія", 2 + i % 4)
+             for i in range(num) ]
+
+
+async def bench_logger(rows: list) -> float:
+    logger = Logger.with_default_handlers(name='NoPrintLogger')
+    start = time.perf_counter()
+    for id, date_of, teacher, student, subject, grade in rows:
+        await logger.info(FMT % (id, date_of, teacher, student, subject, grade))
+    await logger.shutdown()
+    return time.perf_counter() - start
+
+
+def bench_writer(rows: list) -> float:
+    start = time.perf_counter()
+    with ResultWriter() as out:
+        out.rows(FMT, rows)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rows = fake_grades(num)
+
+    t_writer = bench_writer(rows)
+    # aiologger.shutdown() closes sys.stdout, so it goes last
+    t_logger = asyncio.run(bench_logger(rows))
+
+    print(f"{num} rows", file=sys.stderr)
+    for name, t in (("aiologger per row", t_logger), ("ResultWriter", t_writer)):
+        print("%20s: %8.3f s  %12.0f rows/s" % (name, t, num / t), file=sys.stderr)
+    print("%20s: %8.1fx" % ("speedup", t_logger / t_writer), file=sys.stderr)
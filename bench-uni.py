@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+
+"""
+End-to-end benchmark against a throw-away local PostgreSQL cluster.
+
+A cluster is created with initdb in a temporary directory (no docker, no
+config.ini), loaded at every scale factor and then timed:
+
+    load      bulk load (COPY) of the generated dataset
+    report    every uni-select-??.py report
+    crud      every seed.py CRUD option (rolled back after each run)
+
+For each item p50/p95/p99 latency, rows/sec and shared buffer hits/reads
+(per run) are printed and written as JSON, which can be compared between
+runs:
+
+    ./bench-uni.py --scale 1 10 100 --runs 20 --json bench-new.json
+    ./bench-uni.py --compare bench-old.json bench-new.json
+
+initdb refuses to run as root; --pg-bin points at the PostgreSQL binaries
+when initdb is not on PATH.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from aiologger import Logger
+from aiologger.handlers.streams import AsyncStreamHandler
+from aiologger.levels import LogLevel
+from datetime import date, datetime
+import json
+import os
+from pathlib import Path
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from uni_output import ResultWriter
+
+uni_model = __import__("uni-model")
+Base = getattr(uni_model, "Base")
+
+REPORTS = sorted(p.stem for p in Path(__file__).parent.glob("uni-select-??.py"))
+
+SUBJECTS = [ "Компесаторна негентропія", "Девіаторна алгебра", "SOLID'ософія"
+           , "Мультиарний аналіз", "Хаотичний синтез", "Археологія Абсурдології"
+           , "Квантова Алхімія", "Предикативна Квінциляція" ]
+TEACHER_DEGREE = ['проф.','д-р.','к.ф-м.н','PhD','к.т.н']
+
+# Per scale factor 1
+NUM_GROUPS, NUM_TEACHERS, NUM_STUDENTS = 3, 5, 40
+SUBJECTS_PER_STUDENT, GRADES_PER_STUDENT = 5, 20
+STUDY_DAYS = 30 * 3
+
+# Block counters of our tables and indexes that this backend has not yet
+# flushed to pg_statio_*. No flush happens inside a transaction, so the
+# difference before/after the work is exactly what the work touched.
+XACT_BLOCKS = """
+SELECT coalesce(sum(pg_stat_get_xact_blocks_hit(c.oid)), 0),
+       coalesce(sum(pg_stat_get_xact_blocks_fetched(c.oid)
+                    - pg_stat_get_xact_blocks_hit(c.oid)), 0)
+FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = 'public' AND c.relkind IN ('r', 'i')
+"""
+
+
+class CountingWriter(ResultWriter):
+    """Text writer into /dev/null that counts the rows it was given
+    """
+    def __init__(self):
+        super().__init__(os.devnull)
+        self.count = 0
+
+    def write_batch(self, fmt: str, batch: list) -> None:
+        self.count += len(batch)
+        super().write_batch(fmt, batch)
+
+
+class LocalCluster:
+    """initdb + pg_ctl in a temporary directory, trust auth on 127.0.0.1
+    """
+    def __init__(self, pg_bin: str | None = None):
+        self.bin = Path(pg_bin) if pg_bin else self.find_bin()
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        self.dir = None
+
+    @staticmethod
+    def find_bin() -> Path:
+        initdb = shutil.which("initdb")
+        if initdb:
+            return Path(initdb).parent
+        pg_config = shutil.which("pg_config")
+        if pg_config:
+            return Path(subprocess.check_output([pg_config, "--bindir"],
+                                                text=True).strip())
+        raise SystemExit("initdb not found: use --pg-bin DIR")
+
+    def url(self, dbname: str) -> str:
+        return f"postgresql+asyncpg://postgres@127.0.0.1:{self.port}/{dbname}"
+
+    def start(self) -> None:
+        self.dir = tempfile.mkdtemp(prefix="uni-bench-")
+        data = os.path.join(self.dir, "data")
+        subprocess.run([self.bin / "initdb", "-D", data, "-U", "postgres",
+                        "-A", "trust", "-E", "UTF8", "--locale=C.UTF-8"],
+                       check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([self.bin / "pg_ctl", "-D", data, "-w",
+                        "-l", os.path.join(self.dir, "server.log"),
+                        "-o", f"-p {self.port} -k {self.dir} "
+                              "-c listen_addresses=127.0.0.1", "start"],
+                       check=True, stdout=subprocess.DEVNULL)
+
+    def stop(self) -> None:
+        if self.dir is None:
+            return
+        subprocess.run([self.bin / "pg_ctl", "-D", os.path.join(self.dir, "data"),
+                        "-m", "fast", "stop"], stdout=subprocess.DEVNULL)
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir = None
+
+
+def dataset(scale: int, seed: int = 1) -> dict:
+    """Rows of every table at SCALE, with explicit ids (reports use fixed ids)
+    """
+    rnd = random.Random(seed)
+    subjects = [ (i + 1, SUBJECTS[i % len(SUBJECTS)] +
+                         ("" if i < len(SUBJECTS) else f" {i // len(SUBJECTS) + 1}"))
+                 for i in range(len(SUBJECTS) * scale) ]
+    groups = [ (i + 1, ["GOIT-31", "TOGI-32", "TIGO-33"][i] if i < 3 else f"GRP-{i + 1}")
+               for i in range(NUM_GROUPS * scale) ]
+    teachers = [ (i + 1, f"{TEACHER_DEGREE[i % len(TEACHER_DEGREE)]} "
+                         f"Викладач{i + 1} Прізвище{i + 1}")
+                 for i in range(NUM_TEACHERS * scale) ]
+    students = [ (i + 1, f"Прізвище{i + 1}, Ім'я{i + 1}", rnd.randint(1, len(groups)))
+                 for i in range(NUM_STUDENTS * scale) ]
+
+    by_subject = { sid: [] for sid, _ in subjects }
+    teacher_subjects = []
+    for sid, _ in subjects:
+        for tid in { (sid - 1) % len(teachers) + 1, rnd.randint(1, len(teachers)) }:
+            teacher_subjects.append((len(teacher_subjects) + 1, tid, sid))
+            by_subject[sid].append(tid)
+
+    student_subjects, grades = [], []
+    ord_today = date.today().toordinal()
+    for did, _, _ in students:
+        listens = rnd.sample(range(1, len(subjects) + 1), SUBJECTS_PER_STUDENT)
+        first = len(student_subjects) + 1
+        student_subjects.extend((first + n, did, sid)
+                                for n, sid in enumerate(listens))
+        for _ in range(rnd.randint(1, 2 * GRADES_PER_STUDENT - 1)):
+            sid = rnd.choice(listens)
+            grades.append((len(grades) + 1,
+                           date.fromordinal(ord_today - rnd.randint(0, STUDY_DAYS - 1)),
+                           rnd.choice((2, 3, 3, 4, 4, 4, 5, 5, 5, 5)),
+                           did, sid, rnd.choice(by_subject[sid])))
+    return {
+        "subjects": (("id", "title"), subjects),
+        "groups": (("id", "codename"), groups),
+        "teachers": (("id", "fullname"), teachers),
+        "students": (("id", "fullname", "group_id"), students),
+        "teacher_subjects": (("id", "teacher_id", "subject_id"), teacher_subjects),
+        "student_subjects": (("id", "student_id", "subject_id"), student_subjects),
+        "grades": (("id", "date_of", "grade", "student_id", "subject_id", "teacher_id"),
+                   grades),
+    }
+
+
+async def create_schema(engine) -> None:
+    async with engine.begin() as conn:
+        await conn.exec_driver_sql("DROP SCHEMA public CASCADE;")
+        await conn.exec_driver_sql("CREATE SCHEMA public;")
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def bulk_load(engine, data: dict) -> dict:
+    async with engine.connect() as conn:
+        raw = (await conn.get_raw_connection()).driver_connection
+        start = time.perf_counter()
+        async with raw.transaction():
+            for table, (columns, rows) in data.items():
+                await raw.copy_records_to_table(table, records=rows, columns=columns)
+                await raw.execute(f"SELECT setval(pg_get_serial_sequence("
+                                  f"'{table}', 'id'), "
+                                  f"(SELECT coalesce(max(id), 1) FROM {table}))")
+        elapsed = time.perf_counter() - start
+        await raw.execute("ANALYZE")
+    rows = sum(len(rows) for _, rows in data.values())
+    return summary("load", "bulk load", [elapsed], rows, 0, 0)
+
+
+def summary(group: str, name: str, samples: list, rows: int,
+            blks_hit: int, blks_read: int, error: str | None = None) -> dict:
+    if len(samples) > 1:
+        q = statistics.quantiles(samples, n=100, method="inclusive")
+        p50, p95, p99 = q[49], q[94], q[98]
+    else:
+        p50 = p95 = p99 = samples[0] if samples else 0.0
+    mean = statistics.fmean(samples) if samples else 0.0
+    return { "group": group, "name": name, "runs": len(samples)
+           , "p50_ms": p50 * 1000, "p95_ms": p95 * 1000, "p99_ms": p99 * 1000
+           , "mean_ms": mean * 1000, "rows": rows
+           , "rows_per_s": rows / mean if rows and mean else None
+           , "blks_hit": blks_hit, "blks_read": blks_read, "error": error }
+
+
+async def measure(engine, group: str, name: str, work, runs: int,
+                  out: CountingWriter) -> dict:
+    """Run WORK(conn) RUNS times (plus one warm-up), each in its own
+    transaction that is rolled back afterwards
+    """
+    samples, hit, read = [], 0, 0
+    for n in range(runs + 1):
+        async with engine.connect() as conn:
+            await conn.begin()
+            h0, r0 = map(int, (await conn.execute(text(XACT_BLOCKS))).one())
+            out.count = 0
+            start = time.perf_counter()
+            try:
+                await work(conn)
+            except Exception as e:
+                return summary(group, name, samples, 0, 0, 0,
+                               f"{type(e).__name__}: {e}")
+            elapsed = time.perf_counter() - start
+            h, r = map(int, (await conn.execute(text(XACT_BLOCKS))).one())
+            await conn.rollback()
+        if n:           # the first run only warms caches up
+            samples.append(elapsed)
+            hit, read = hit + h - h0, read + r - r0
+    return summary(group, name, samples, out.count, hit // runs, read // runs)
+
+
+def session_factory(conn) -> async_sessionmaker[AsyncSession]:
+    # commit() inside reports and options only releases a savepoint
+    return async_sessionmaker(bind=conn, expire_on_commit=False,
+                              join_transaction_mode="create_savepoint")
+
+
+def report_work(fn):
+    async def work(conn):
+        await fn(session_factory(conn))
+    return work
+
+
+def crud_work(seed, steps: list):
+    async def work(conn):
+        async with session_factory(conn)() as session:
+            for opt, arg_list in steps:
+                await seed.options[opt][0](session, arg_list)
+            await session.flush()
+    return work
+
+
+def crud_items(data: dict) -> list:
+    """(name, [(option, arg_list), ...]) for every seed.py option. Objects
+    referenced by grades cannot be deleted, so deletes remove what the same
+    transaction has just created.
+    """
+    subject, subject2 = data["subjects"][1][0][1], data["subjects"][1][1][1]
+    group = data["groups"][1][0][1]
+    teacher = data["teachers"][1][0][1]
+    student = data["students"][1][0][1]
+    day = data["grades"][1][0][1].isoformat()
+    new_subject, new_group = "Бенч предмет", "BENCH-1"
+    new_student, new_teacher = "Бенч, Студент", "проф. Бенч Викладач"
+    return [
+        ("cS", [("cS", [new_subject])]),
+        ("cG", [("cG", [new_group])]),
+        ("cs", [("cs", [new_student, group, subject, subject2])]),
+        ("cT", [("cT", [new_teacher, subject, subject2])]),
+        ("cg", [("cg", [day, student, "4", teacher, subject])]),
+        ("rS", [("rS", ["*"])]),
+        ("rG", [("rG", ["*"])]),
+        ("rs", [("rs", ["*"])]),
+        ("rT", [("rT", ["*"])]),
+        ("rg", [("rg", [f"*{subject}*"])]),
+        ("uS", [("uS", [subject, new_subject])]),
+        ("uG", [("uG", [group, new_group])]),
+        ("us", [("us", [student, new_student, group, subject])]),
+        ("uT", [("uT", [teacher, new_teacher, subject])]),
+        ("cS+dS", [("cS", [new_subject]), ("dS", [new_subject])]),
+        ("cG+dG", [("cG", [new_group]), ("dG", [new_group])]),
+        ("cs+ds", [("cs", [new_student, group, subject]), ("ds", [new_student])]),
+        ("cT+dT", [("cT", [new_teacher, subject]), ("dT", [new_teacher])]),
+        ("dg", [("dg", [f"*{subject}*"])]),
+    ]
+
+
+def quiet_logger() -> Logger:
+    logger = Logger(name='NoPrintLogger', level=LogLevel.WARNING)
+    logger.add_handler(AsyncStreamHandler(stream=sys.stderr, level=LogLevel.WARNING))
+    return logger
+
+
+async def bench_scale(cluster: LocalCluster, scale: int, runs: int) -> list:
+    admin = create_async_engine(cluster.url("postgres"), isolation_level="AUTOCOMMIT")
+    async with admin.connect() as conn:
+        await conn.exec_driver_sql("DROP DATABASE IF EXISTS uni_bench")
+        await conn.exec_driver_sql("CREATE DATABASE uni_bench")
+    await admin.dispose()
+
+    engine = create_async_engine(cluster.url("uni_bench"), pool_size=1, max_overflow=0)
+    await create_schema(engine)
+    data = dataset(scale)
+    results = [await bulk_load(engine, data)]
+
+    logger, out = quiet_logger(), CountingWriter()
+    for stem in REPORTS:
+        mod = __import__(stem)
+        mod.logger, mod.out = logger, out
+        fn = getattr(mod, "select_" + stem[-2:])
+        results.append(await measure(engine, "report", stem, report_work(fn),
+                                     runs, out))
+
+    seed = __import__("seed")
+    seed.logger, seed.out = logger, out
+    for name, steps in crud_items(data):
+        results.append(await measure(engine, "crud", name, crud_work(seed, steps),
+                                     runs, out))
+
+    await engine.dispose()
+    await logger.shutdown()
+    out.close()
+    for r in results:
+        r["scale"] = scale
+    return results
+
+
+def print_results(results: list) -> None:
+    print("%5s %-6s %-16s %9s %9s %9s %12s %9s %9s" % (
+        "scale", "group", "name", "p50 ms", "p95 ms", "p99 ms", "rows/s",
+        "blk hit", "blk read"))
+    for r in results:
+        if r["error"]:
+            print("%5d %-6s %-16s %s" % (r["scale"], r["group"], r["name"], r["error"]))
+            continue
+        print("%5d %-6s %-16s %9.3f %9.3f %9.3f %12s %9d %9d" % (
+            r["scale"], r["group"], r["name"], r["p50_ms"], r["p95_ms"],
+            r["p99_ms"],
+            "%.0f" % r["rows_per_s"] if r["rows_per_s"] else "-",
+            r["blks_hit"], r["blks_read"]))
+
+
+def compare(old_path: str, new_path: str, threshold: float) -> int:
+    """Print p50/p95 ratios new/old per item; return the number of items
+    whose p95 grew by more than THRESHOLD
+    """
+    def load(path):
+        with open(path, encoding="utf-8") as f:
+            return { (r["scale"], r["group"], r["name"]): r
+                     for r in json.load(f)["results"] }
+    old, new = load(old_path), load(new_path)
+    regressions = 0
+    print("%5s %-6s %-16s %9s %9s %9s %9s" % (
+        "scale", "group", "name", "old p95", "new p95", "p50 x", "p95 x"))
+    for key in sorted(old.keys() & new.keys()):
+        o, n = old[key], new[key]
+        if o["error"] or n["error"] or not o["p50_ms"] or not o["p95_ms"]:
+            continue
+        p50x, p95x = n["p50_ms"] / o["p50_ms"], n["p95_ms"] / o["p95_ms"]
+        flag = ""
+        if p95x > threshold:
+            flag = "  <-- slower"
+            regressions += 1
+        print("%5d %-6s %-16s %9.3f %9.3f %9.2f %9.2f%s" % (
+            *key, o["p95_ms"], n["p95_ms"], p50x, p95x, flag))
+    return regressions
+
+
+async def async_main(args) -> list:
+    cluster = LocalCluster(args.pg_bin)
+    cluster.start()
+    try:
+        results = []
+        for scale in args.scale:
+            results.extend(await bench_scale(cluster, scale, args.runs))
+        return results
+    finally:
+        cluster.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10],
+                        help="Scale factors (default: 1 10)")
+    parser.add_argument("--runs", type=int, default=20,
+                        help="Timed runs per item (default: 20)")
+    parser.add_argument("--json", metavar="FILE", default="bench-results.json",
+                        help="Machine-readable results (default: bench-results.json)")
+    parser.add_argument("--pg-bin", metavar="DIR", default=None,
+                        help="Directory with initdb and pg_ctl")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="Compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="p95 growth reported as a regression (default: 1.2)")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    if platform.system() == 'Windows':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    results = asyncio.run(async_main(args))
+    print_results(results)
+    with open(args.json, "w", encoding="utf-8") as f:
+        json.dump({ "started": datetime.now().isoformat(timespec="seconds")
+                  , "python": platform.python_version()
+                  , "scales": args.scale, "runs": args.runs
+                  , "results": results }, f, ensure_ascii=False, indent=2)
+    print(f"Results: {args.json}")
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+"""
+Failure check of seed.py runs: what a failing option leaves behind.
+
+Every scenario runs its options through seed.run_options() against a fresh
+copy of a seeded temporary cluster (see bench-uni.py). Afterwards a query
+checks what was committed and the log must hold the expected message. The
+check fails (exit status 1) when a scenario does not hold.
+
+    ./check-failures.py -v
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from pathlib import Path
+import platform
+import sys
+import tempfile
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from uni_engine import Router
+
+bench = __import__("bench-uni")
+
+# A grade line whose student name is not quoted: one field too many
+MALFORMED_CSV = ("date_of,student,grade,teacher,subject\n"
+                 "2023-09-01,Чек, Студент,5,проф. Чек Викладач,Чек предмет\n")
+
+
+def refuse_deletes(table: str) -> list:
+    """Setup SQL: every DELETE from TABLE fails
+    """
+    return [
+        "CREATE OR REPLACE FUNCTION check_refuse() RETURNS trigger"
+        " LANGUAGE plpgsql AS $$ BEGIN"
+        " RAISE EXCEPTION 'check-failures: % refused', TG_TABLE_NAME;"
+        " END $$",
+        f"CREATE TRIGGER check_refuse BEFORE DELETE ON {table}"
+        " FOR EACH STATEMENT EXECUTE FUNCTION check_refuse()",
+    ]
+
+
+def scenarios(files: Path) -> list:
+    """(name, setup SQL, options, session.info settings, check SQL that
+    must return true, log text)
+    """
+    malformed = files / "malformed.csv"
+    malformed.write_text(MALFORMED_CSV, encoding="utf-8")
+    subject = bench.SUBJECTS[0]
+    grades = ("SELECT count(*) FROM grades g JOIN subjects s"
+              f" ON s.id = g.subject_id WHERE s.title = '{subject}'")
+    kept = ("SELECT NOT EXISTS (SELECT FROM subjects"
+            f" WHERE title = 'Чек предмет') AND ({grades}) > 0")
+    return [
+        ("malformed import keeps the options before it", [],
+         [("cS", ["Чек предмет"]), ("import-grades", [str(malformed)])], {},
+         "SELECT count(*) = 1 FROM subjects WHERE title = 'Чек предмет'",
+         f"Cannot import '{malformed}', line 2"),
+        # the subject's grades go first: the failure comes after them
+        ("failed delete does not commit a create before it",
+         refuse_deletes("subjects"),
+         [("cS", ["Чек предмет"]), ("dS", [subject])], {"delete_batch": 10},
+         kept, "subjects refused"),
+        ("same with --commit-batches", refuse_deletes("subjects"),
+         [("cS", ["Чек предмет"]), ("dS", [subject])],
+         {"commit_batches": True, "delete_batch": 10},
+         kept, "subjects refused"),
+        ("--commit-batches alone keeps the batches done", refuse_deletes("subjects"),
+         [("dS", [subject])], {"commit_batches": True, "delete_batch": 10},
+         f"SELECT ({grades}) = 0", "subjects refused"),
+    ]
+
+
+class CapturingLogger:
+    """The logger calls seed.py makes, kept as (level, message)
+    """
+    def __init__(self):
+        self.records = []
+
+    async def info(self, msg: str) -> None:
+        self.records.append(("info", msg))
+
+    async def warning(self, msg: str) -> None:
+        self.records.append(("warning", msg))
+
+    async def error(self, msg: str) -> None:
+        self.records.append(("error", msg))
+
+    def text(self) -> str:
+        return "\n".join(f"{level}: {msg}" for level, msg in self.records)
+
+
+async def run_scenario(cluster, seed, number: int, setup: list,
+                       ordered: list, settings: dict, check_sql: str) -> bool:
+    dbname = f"uni_failures_{number}"
+    admin = create_async_engine(cluster.url("postgres"), isolation_level="AUTOCOMMIT")
+    async with admin.connect() as conn:
+        await conn.exec_driver_sql(f"CREATE DATABASE {dbname} "
+                                   "TEMPLATE uni_failures")
+    await admin.dispose()
+
+    engine = create_async_engine(cluster.url(dbname))
+    try:
+        async with engine.begin() as conn:
+            for sql in setup:
+                await conn.exec_driver_sql(sql)
+        await seed.run_options(Router(engine), ordered, settings=settings)
+        async with engine.connect() as conn:
+            return bool((await conn.execute(text(check_sql))).scalar())
+    finally:
+        await engine.dispose()
+
+
+async def check(cluster, verbose: bool) -> int:
+    admin = create_async_engine(cluster.url("postgres"), isolation_level="AUTOCOMMIT")
+    async with admin.connect() as conn:
+        await conn.exec_driver_sql("CREATE DATABASE uni_failures")
+    await admin.dispose()
+
+    engine = create_async_engine(cluster.url("uni_failures"))
+    await bench.create_schema(engine)
+    await bench.bulk_load(engine, bench.dataset(1))
+    await engine.dispose()
+
+    seed = __import__("seed")
+    seed.out = bench.CountingWriter()
+
+    failed = 0
+    with tempfile.TemporaryDirectory(prefix="uni-failures-") as files:
+        for number, (name, setup, ordered, settings, check_sql, expected) \
+                in enumerate(scenarios(Path(files)), 1):
+            seed.logger = CapturingLogger()
+            committed = await run_scenario(cluster, seed, number, setup,
+                                           ordered, settings, check_sql)
+            issues = []
+            if not committed:
+                issues.append("check query failed")
+            if expected not in seed.logger.text():
+                issues.append(f"no log line with '{expected}'")
+            print("%-50s  %s" % (name, "; ".join(issues) or "ok"))
+            if verbose:
+                for line in seed.logger.text().splitlines():
+                    print(f"    {line}")
+            failed += bool(issues)
+
+    seed.out.close()
+    print(f"{failed} scenario(s) failed")
+    return failed
+
+
+async def async_main(args) -> int:
+    cluster = bench.LocalCluster(args.pg_bin)
+    cluster.start()
+    try:
+        return await check(cluster, args.verbose)
+    finally:
+        cluster.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pg-bin", metavar="DIR", default=None,
+                        help="Directory with initdb and pg_ctl")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Print the log of every scenario")
+    args = parser.parse_args()
+
+    if platform.system() == 'Windows':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    sys.exit(1 if asyncio.run(async_main(args)) else 0)
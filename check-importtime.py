@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+"""
+Import-time budget of the command-line entry points.
+
+Every entry point is imported (not run) RUNS times in a fresh interpreter
+under `python -X importtime`, each time after an import of BASELINE; the
+fastest run of each counts. The check fails (exit status 1) when an entry
+point takes longer than its BUDGET times the baseline, or imports a module
+from LAZY or from its own LAZY_IN: those may be loaded only on the paths
+that need them.
+
+    ./check-importtime.py -v
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import subprocess
+import sys
+
+HERE = Path(__file__).parent
+
+# Import time as a multiple of BASELINE's, which every entry point pays
+# anyway: a ratio holds on a slower or busier machine, where milliseconds do
+# not. Measured: seed ~1.25, a report ~1.05; the budgets leave ~28 % for
+# noise. Eager Faker in seed goes over. A ratchet like check-roundtrips.py
+# BOUNDS: lower them whenever an entry point gets cheaper.
+BASELINE = "sqlalchemy.ext.asyncio"
+BUDGET = {
+    "seed": 1.6,
+    **{ f"uni-select-{n:02d}": 1.35 for n in range(1, 13) },
+}
+LAZY = ("faker", "pyarrow", "uvloop", "uni_explain", "cProfile", "tracemalloc")
+# a report builds its statement template, and loads the model, when it runs
+LAZY_IN = { f"uni-select-{n:02d}": ("uni-model",) for n in range(1, 13) }
+RUNS = 5
+
+
+def import_times(module: str) -> dict:
+    """module -> cumulative import time in microseconds, one fresh import
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"__import__({module!r})"],
+        cwd=HERE, capture_output=True, text=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def check(runs: int, scale: float, verbose: bool) -> int:
+    failed = 0
+    print("%-16s %8s %8s %6s %6s  %s" % ("entry point", "ms", "base ms",
+                                         "ratio", "budget", "issues"))
+    for module, budget in BUDGET.items():
+        best = base = None
+        times = {}
+        for _ in range(runs):
+            # alternate: a load that comes and goes slows both alike
+            t = import_times(BASELINE)[BASELINE]
+            base = t if base is None else min(base, t)
+            times = import_times(module)
+            if best is None or times[module] < best:
+                best = times[module]
+        eager = [ m for m in LAZY + LAZY_IN.get(module, ()) if m in times ]
+        issues = [ f"imports {m}" for m in eager ]
+        ratio = best / base
+        if ratio > budget * scale:
+            issues.append(f"over budget by {ratio - budget * scale:.2f}")
+        print("%-16s %8.1f %8.1f %6.2f %6.2f  %s" % (
+            module, best / 1000, base / 1000, ratio, budget * scale,
+            "; ".join(issues) or "ok"))
+        if verbose:
+            top = sorted(( (t, m) for m, t in times.items()
+                           if m != module and "." not in m ), reverse=True)
+            for t, m in top[:8]:
+                print("%20s %8.1f ms" % (m, t / 1000))
+        failed += bool(issues)
+    print(f"{failed} entry point(s) failed")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=RUNS,
+                        help=f"Imports per entry point, the fastest counts "
+                             f"(default: {RUNS})")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Multiply every budget")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Print the costliest imported packages")
+    args = parser.parse_args()
+    sys.exit(1 if check(args.runs, args.scale, args.verbose) else 0)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+"""
+Statement-count / N+1 check of the seed.py CRUD options.
+
+Every option runs against a seeded temporary cluster (see bench-uni.py)
+in a transaction that is rolled back. A before_cursor_execute hook records
+each statement sent to the server. Per option the harness prints the round
+trips and repeated statements. It fails (exit status 1) when an option
+exceeds its bound in BOUNDS. Multi-subject options also run with one extra
+subject: each extra argument must cost at most PER_ARG round trips.
+
+    ./check-roundtrips.py -v
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections import Counter
+import platform
+import sys
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession
+
+bench = __import__("bench-uni")
+
+# Upper bounds of round trips per option for the arguments built in items().
+# They are a ratchet: lower them whenever an option gets cheaper.
+BOUNDS = {
+    "cS": 1, "cG": 1, "cs": 4, "cT": 3, "cg": 4,
+    "rS": 1, "rG": 1, "rs": 1, "rT": 1, "rg": 1,
+    "uS": 1, "uG": 1, "us": 5, "uT": 4,
+    "dS": 8, "dG": 8, "ds": 6, "dT": 6, "dg": 2,
+}
+# Deletes select the target ids, then per batch of them the ids of every
+# referencing table, and delete each table's rows by id: one SELECT and at
+# most one DELETE per table involved.
+# Round trips an extra SUBJECT argument may add (options with SUBJECT1 ...):
+# none, all subjects are resolved by one query and linked by one INSERT.
+PER_ARG = { "cs": 0, "cT": 0, "us": 0, "uT": 0 }
+
+
+def items(data: dict, extra: int = 0) -> list:
+    """(option, setup steps, arg_list); setup steps run before recording
+    """
+    subjects = [ title for _, title in data["subjects"][1][:3 + extra] ]
+    group = data["groups"][1][0][1]
+    teacher = data["teachers"][1][0][1]
+    student = data["students"][1][0][1]
+    day = data["grades"][1][0][1].isoformat()
+    new_subject, new_group = "Бенч предмет", "BENCH-1"
+    new_student, new_teacher = "Бенч, Студент", "проф. Бенч Викладач"
+    return [
+        ("cS", [], [new_subject]),
+        ("cG", [], [new_group]),
+        ("cs", [], [new_student, group, *subjects[1:]]),
+        ("cT", [], [new_teacher, *subjects[1:]]),
+        ("cg", [], [day, student, "4", teacher, subjects[0]]),
+        ("rS", [], ["*"]),
+        ("rG", [], ["*"]),
+        ("rs", [], ["*"]),
+        ("rT", [], ["*"]),
+        ("rg", [], [f"*{subjects[0]}*"]),
+        ("uS", [], [subjects[0], new_subject]),
+        ("uG", [], [group, new_group]),
+        ("us", [], [student, new_student, group, *subjects[2:]]),
+        ("uT", [], [teacher, new_teacher, *subjects[2:]]),
+        ("dS", [("cS", [new_subject])], [new_subject]),
+        ("dG", [("cG", [new_group])], [new_group]),
+        ("ds", [("cs", [new_student, group, subjects[0]])], [new_student]),
+        ("dT", [("cT", [new_teacher, subjects[0]])], [new_teacher]),
+        ("dg", [], [f"*{subjects[0]}*"]),
+    ]
+
+
+async def record(engine, seed, opt: str, setup: list, arg_list: list) -> list:
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context,
+                              executemany):
+        statements.append(statement)
+
+    async with engine.connect() as conn:
+        await conn.begin()
+        async with AsyncSession(bind=conn) as session:
+            for s_opt, s_args in setup:
+                await seed.options[s_opt][0](session, s_args)
+            await session.flush()
+            event.listen(engine.sync_engine, "before_cursor_execute",
+                         before_cursor_execute)
+            try:
+                await seed.options[opt][0](session, arg_list)
+                await session.flush()
+            finally:
+                event.remove(engine.sync_engine, "before_cursor_execute",
+                             before_cursor_execute)
+        await conn.rollback()
+    return statements
+
+
+async def check(cluster, verbose: bool) -> int:
+    admin = create_async_engine(cluster.url("postgres"), isolation_level="AUTOCOMMIT")
+    async with admin.connect() as conn:
+        await conn.exec_driver_sql("CREATE DATABASE uni_roundtrips")
+    await admin.dispose()
+
+    engine = create_async_engine(cluster.url("uni_roundtrips"))
+    await bench.create_schema(engine)
+    data = bench.dataset(1)
+    await bench.bulk_load(engine, data)
+
+    seed = __import__("seed")
+    seed.logger, seed.out = bench.quiet_logger(), bench.CountingWriter()
+
+    failed = 0
+    base = { opt: (setup, args) for opt, setup, args in items(data) }
+    more = { opt: (setup, args) for opt, setup, args in items(data, extra=1) }
+    print("%-4s %6s %6s %8s %8s  %s" % ("opt", "trips", "bound", "+1 arg",
+                                       "per arg", "issues"))
+    for opt, (setup, arg_list) in base.items():
+        statements = await record(engine, seed, opt, setup, arg_list)
+        over, notes = [], []
+        if len(statements) > BOUNDS[opt]:
+            over.append(f"{len(statements)} round trips > {BOUNDS[opt]}")
+        repeated = [ s for s, n in Counter(statements).items() if n > 1 ]
+        if repeated:
+            notes.append(f"{len(repeated)} statement(s) repeated")
+
+        grown = ""
+        if opt in PER_ARG:
+            grown = len(await record(engine, seed, opt, *more[opt]))
+            if grown - len(statements) > PER_ARG[opt]:
+                over.append(f"+{grown - len(statements)} per extra argument "
+                            f"> {PER_ARG[opt]}")
+
+        print("%-4s %6d %6d %8s %8s  %s" % (
+            opt, len(statements), BOUNDS[opt], grown,
+            grown - len(statements) if grown != "" else "",
+            "; ".join(over + notes) or "ok"))
+        if verbose:
+            for statement, n in Counter(statements).items():
+                print("       %3dx %s" % (n, " ".join(statement.split())[:100]))
+        failed += bool(over)
+
+    await seed.logger.shutdown()
+    seed.out.close()
+    await engine.dispose()
+    print(f"{failed} option(s) over their bounds")
+    return failed
+
+
+async def async_main(args) -> int:
+    cluster = bench.LocalCluster(args.pg_bin)
+    cluster.start()
+    try:
+        return await check(cluster, args.verbose)
+    finally:
+        cluster.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pg-bin", metavar="DIR", default=None,
+                        help="Directory with initdb and pg_ctl")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Print the recorded statements")
+    args = parser.parse_args()
+
+    if platform.system() == 'Windows':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    sys.exit(1 if asyncio.run(async_main(args)) else 0)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+"""
+Compare query plans captured with --explain against baseline plans:
+
+    ./uni-select-01.py --explain plans/baseline     # once, on seeded data
+    ./seed.py --rg '*Алхімія*' --explain plans/baseline
+    ...                                              # change indexes/schema
+    ./uni-select-01.py --explain plans/current
+    ./explain-check.py plans/baseline plans/current
+
+Flags new sequential scans on 'grades', row-estimate errors and cost
+jumps. Exit status is 1 when any plan has issues.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+
+from uni_explain import compare_dirs, ROWS_FACTOR, COST_FACTOR
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline", metavar="BASELINE_DIR")
+    parser.add_argument("current", metavar="CURRENT_DIR")
+    parser.add_argument("--rows-factor", type=float, default=ROWS_FACTOR,
+                        help=f"Row estimate error to flag (default: {ROWS_FACTOR})")
+    parser.add_argument("--cost-factor", type=float, default=COST_FACTOR,
+                        help=f"Cost growth to flag (default: {COST_FACTOR})")
+    args = parser.parse_args()
+
+    report = compare_dirs(args.baseline, args.current,
+                          args.rows_factor, args.cost_factor)
+    failed = 0
+    for name, issues in report.items():
+        print("%-24s %s" % (name, "FAIL" if issues else "ok"))
+        for issue in issues:
+            print(f"    {issue}")
+        failed += bool(issues)
+    print(f"{failed} of {len(report)} plan(s) with issues")
+    sys.exit(1 if failed else 0)
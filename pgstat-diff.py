@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+"""
+What the server did during a workload: snapshot pg_stat_statements,
+pg_stat_user_tables and pg_statio_user_tables before and after it, print
+the difference.
+
+    ./pgstat-diff.py -- ./seed.py --rg '*Алхімія*'
+    ./pgstat-diff.py --metrics m.json -- ./seed.py --report 03 --metrics m.json
+    ./pgstat-diff.py --save before.json; ...; ./pgstat-diff.py --since before.json
+
+Statements are listed by their fingerprint id, the one seed.py --metrics
+and the SLOW_QUERY_MS log print; with --metrics FILE the client-side mean
+of the same fingerprint is shown next to the server's. Tables show
+sequential against index scans and buffer hits against reads.
+
+pg_stat_statements has to be in shared_preload_libraries and created in
+the database (CREATE EXTENSION pg_stat_statements); without it only the
+tables are compared.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from datetime import datetime
+import json
+from pathlib import Path
+import subprocess
+import sys
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from uni_engine import create_engine, run
+from uni_metrics import fingerprint
+
+TOP = 20
+SETTLE = 0.5    # seconds for the workload's backends to report their stats
+SQL_WIDTH = 60
+
+# the snapshot queries themselves are left out of the diff by this tag
+TAG = "/* pgstat-diff */ "
+
+STATEMENTS = TAG + """
+SELECT queryid::text, query, calls, total_exec_time, rows,
+       shared_blks_hit, shared_blks_read
+FROM pg_stat_statements
+WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+"""
+STATEMENT_COLUMNS = ("calls", "total_ms", "rows", "hit", "read")
+
+TABLES = TAG + """
+SELECT t.relname, t.seq_scan, t.seq_tup_read,
+       COALESCE(t.idx_scan, 0), COALESCE(t.idx_tup_fetch, 0),
+       t.n_tup_ins, t.n_tup_upd, t.n_tup_del,
+       COALESCE(io.heap_blks_hit, 0), COALESCE(io.heap_blks_read, 0),
+       COALESCE(io.idx_blks_hit, 0), COALESCE(io.idx_blks_read, 0)
+FROM pg_stat_user_tables t
+JOIN pg_statio_user_tables io USING (relid)
+"""
+TABLE_COLUMNS = ("seq_scan", "seq_tup_read", "idx_scan", "idx_tup_fetch",
+                 "ins", "upd", "del", "heap_hit", "heap_read", "idx_hit",
+                 "idx_read")
+
+
+async def snapshot() -> dict:
+    """Counters now; "statements" is None without pg_stat_statements
+    """
+    engine = create_engine(isolation_level="AUTOCOMMIT")
+    try:
+        async with engine.connect() as conn:
+            tables = { row[0]: list(row[1:])
+                       for row in await conn.execute(text(TABLES)) }
+            try:
+                statements = { row[0]: [row[1], *row[2:]]
+                               for row in await conn.execute(text(STATEMENTS))
+                               if not row[1].startswith(TAG) }
+            except DBAPIError:
+                statements = None
+    finally:
+        await engine.dispose()
+    return {"taken": datetime.now().isoformat(timespec="seconds"),
+            "statements": statements, "tables": tables}
+
+
+def diff_statements(before: dict, after: dict) -> dict:
+    """fingerprint id -> {"sql": ..., counters changed since BEFORE}
+    """
+    result = {}
+    for queryid, (query, *counters) in after.items():
+        old = before.get(queryid, [query] + [0] * len(counters))[1:]
+        delta = [ a - b for a, b in zip(counters, old) ]
+        if not delta[0]:
+            continue                # not called in between
+        key, sql = fingerprint(query)
+        entry = result.setdefault(key, {"sql": sql,
+                                        **dict.fromkeys(STATEMENT_COLUMNS, 0)})
+        for column, value in zip(STATEMENT_COLUMNS, delta):
+            entry[column] += value
+    return result
+
+
+def diff_tables(before: dict, after: dict) -> dict:
+    result = {}
+    for table, counters in after.items():
+        old = before.get(table, [0] * len(counters))
+        delta = [ a - b for a, b in zip(counters, old) ]
+        if any(delta):
+            result[table] = dict(zip(TABLE_COLUMNS, delta))
+    return result
+
+
+def client_means(path: str | None) -> dict:
+    """fingerprint id -> mean ms, from a seed.py --metrics JSON file
+    """
+    if path is None or not Path(path).exists():
+        return {}
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    return { s["id"]: s["total_ms"] / s["count"]
+             for s in data["statements"] if s["count"] }
+
+
+def report(before: dict, after: dict, top: int, metrics: str | None) -> dict:
+    print(f"Server statistics from {before['taken']} to {after['taken']}")
+    diff = {"tables": diff_tables(before["tables"], after["tables"]),
+            "statements": None}
+    if before["statements"] is None or after["statements"] is None:
+        print("pg_stat_statements is not available: statements skipped")
+    else:
+        diff["statements"] = diff_statements(before["statements"],
+                                             after["statements"])
+        means = client_means(metrics)
+        print()
+        print("%-8s %7s %10s %9s %9s %9s %10s %8s  %s" % (
+            "id", "calls", "total ms", "mean ms", "client ms", "rows",
+            "shared hit", "read", "sql"))
+        ranked = sorted(diff["statements"].items(),
+                        key=lambda item: item[1]["total_ms"], reverse=True)
+        for key, s in ranked[:top]:
+            client = means.get(key)
+            print("%-8s %7d %10.1f %9.2f %9s %9d %10d %8d  %s" % (
+                key, s["calls"], s["total_ms"], s["total_ms"] / s["calls"],
+                "" if client is None else f"{client:.2f}", s["rows"],
+                s["hit"], s["read"], s["sql"][:SQL_WIDTH]))
+        if len(ranked) > top:
+            print(f"... {len(ranked) - top} more statement(s)")
+
+    print()
+    print("%-18s %8s %12s %8s %13s %7s %7s %7s %9s %9s %9s %9s" % (
+        "table", *TABLE_COLUMNS))
+    for table, t in sorted(diff["tables"].items()):
+        print("%-18s %8d %12d %8d %13d %7d %7d %7d %9d %9d %9d %9d" % (
+            table, *t.values()))
+    return diff
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs=argparse.REMAINDER,
+                        help="Workload to run between the snapshots, after --")
+    parser.add_argument("--save", metavar="FILE", default=None,
+                        help="Only write a snapshot to FILE")
+    parser.add_argument("--since", metavar="FILE", default=None,
+                        help="Diff a --save snapshot against now")
+    parser.add_argument("--metrics", metavar="FILE", default=None,
+                        help="seed.py --metrics JSON: show client-side means")
+    parser.add_argument("--json", metavar="FILE", default=None,
+                        help="Also write the diff to FILE")
+    parser.add_argument("--top", type=int, default=TOP,
+                        help=f"Statements to print (default: {TOP})")
+    parser.add_argument("--settle", type=float, default=SETTLE,
+                        help="Seconds to wait after the workload "
+                             f"(default: {SETTLE})")
+    args = parser.parse_args()
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(run(snapshot())),
+                                   encoding="utf-8")
+        sys.exit(0)
+    if args.since:
+        before = json.loads(Path(args.since).read_text(encoding="utf-8"))
+        status = 0
+    elif command:
+        before = run(snapshot())
+        status = subprocess.run(command).returncode
+        time.sleep(args.settle)
+    else:
+        parser.error("give a COMMAND, --save or --since")
+    diff = report(before, run(snapshot()), args.top, args.metrics)
+    if args.json:
+        Path(args.json).write_text(json.dumps(diff, ensure_ascii=False,
+                                              indent=1), encoding="utf-8")
+    sys.exit(status)
@@ -0,0 +1,25 @@
+#!/usr/bin/sh
+
+# Streaming replica of local-postgresql (run-docker-postgresql.sh) on port 5433
+
+SCRIPT_NAME="`/usr/bin/basename $0`"
+SCRIPT_DIR="`/usr/bin/dirname $0`"
+
+sudo docker exec local-postgresql sh -c \
+    "grep -q '^host replication' \$PGDATA/pg_hba.conf ||
+     echo 'host replication all all scram-sha-256' >> \$PGDATA/pg_hba.conf"
+sudo docker exec -u postgres local-postgresql pg_ctl reload
+
+sudo docker run --name local-postgresql-replica -p 5433:5432 \
+    --link local-postgresql:primary \
+    -v "$SCRIPT_DIR/pgsql-replica-data":/var/lib/postgresql/data \
+    -e PGPASSWORD=my-secret \
+    -e "TZ=Europe/Kiev" \
+    --entrypoint sh \
+    -d postgres -c '
+        chown postgres /var/lib/postgresql/data
+        chmod 700 /var/lib/postgresql/data
+        [ -s /var/lib/postgresql/data/PG_VERSION ] ||
+            gosu postgres pg_basebackup -h primary -U postgres \
+                -D /var/lib/postgresql/data -R -X stream
+        exec gosu postgres postgres'
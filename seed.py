@@ -2,26 +2,47 @@
 
 from __future__ import annotations
 
+import sys
+
+if __name__ == "__main__" and any(a == "--via" or a.startswith("--via=")
+                                  for a in sys.argv[1:]):
+    # thin client: a running `seed.py --serve` does the work, so SQLAlchemy
+    # and the model are never loaded here
+    from uni_daemon import client_main
+    sys.exit(client_main(sys.argv[1:]))
+
 import argparse
 import asyncio
 from aiologger import Logger
-from configparser import ConfigParser
 from datetime import datetime, date
-from faker import Faker
+import functools
 import os
 from pathlib import Path
-import platform
 import random
+import re
+import shlex
 
-from sqlalchemy import select
+from sqlalchemy import select, bindparam, func, any_
+from sqlalchemy import ARRAY, Integer, String
 from sqlalchemy import update
 from sqlalchemy import delete
 from sqlalchemy import insert
+from sqlalchemy.sql import visitors
 from sqlalchemy.exc import IntegrityError, ObjectNotExecutableError
 from sqlalchemy.exc import ProgrammingError, DBAPIError
-from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
+from uni_engine import Router, create_engine, load_config, run
+import uni_daemon
+import uni_metrics
+from uni_notify import CHANGE_CHANNEL, ChangeFeed
+from uni_profile import add_profile_options, profiler
+from uni_output import WRITERS, add_output_options, diagnostics_logger, open_writer
+from uni_query import CompileStats, NameCache, ResultCache, TABLE_VERSIONS
+from uni_query import PendingNames, name_cache
+from uni_query import decode_cursor, encode_cursor, keyset_page
+import uni_stats
+
 uni_model = __import__("uni-model")
 Base = getattr(uni_model, "Base")
 Subject = getattr(uni_model, "Subject")
@@ -32,14 +53,295 @@ TeacherSubject = getattr(uni_model, "TeacherSubject")
 StudentSubject = getattr(uni_model, "StudentSubject")
 Grade = getattr(uni_model, "Grade")
 
-fake = Faker("uk_UA")
+### Statement templates: built once, executed as TEMPLATE.params(...) ###
+
+GROUP_ID_BY_CODENAME = select(Group.id) \
+        .select_from(Group) \
+        .where(Group.codename.ilike(bindparam("codename")))
+SUBJECT_ID_BY_TITLE = select(Subject.id) \
+        .select_from(Subject) \
+        .where(Subject.title.ilike(bindparam("title")))
+STUDENT_ID_BY_FULLNAME = select(Student.id) \
+        .select_from(Student) \
+        .where(Student.fullname.ilike(bindparam("fullname")))
+TEACHER_ID_BY_FULLNAME = select(Teacher.id) \
+        .select_from(Teacher) \
+        .where(Teacher.fullname.ilike(bindparam("fullname")))
+SUBJECT_IDS_BY_TITLES = select(Subject.id, func.lower(Subject.title)) \
+        .select_from(Subject) \
+        .where(func.lower(Subject.title)
+               == any_(bindparam("titles", type_=ARRAY(String))))
+
+SUBJECTS_LIKE = select(Subject.id, Subject.title) \
+        .select_from(Subject) \
+        .where(Subject.title.ilike(bindparam("pattern")))
+GROUPS_LIKE = select(Group.id, Group.codename) \
+        .select_from(Group) \
+        .where(Group.codename.ilike(bindparam("pattern")))
+STUDENTS_LIKE = select(Student.id, Group.codename, Student.fullname) \
+        .select_from(Student) \
+        .join(Group) \
+        .where(Group.codename.ilike(bindparam("pattern")))
+TEACHERS_LIKE = select(Teacher.id, Teacher.fullname) \
+        .select_from(Teacher) \
+        .where(Teacher.fullname.ilike(bindparam("pattern")))
+
+GRADE_ROWS = select(  Grade.id
+                    , Grade.date_of
+                    , Teacher.fullname
+                    , Student.fullname
+                    , Subject.title
+                    , Grade.grade) \
+        .select_from(Grade) \
+        .join(Teacher) \
+        .join(Student) \
+        .join(Subject)
+GRADES_BY_TEACHER = GRADE_ROWS.where(Teacher.fullname.ilike(bindparam("pattern")))
+GRADES_BY_STUDENT = GRADE_ROWS.where(Student.fullname.ilike(bindparam("pattern")))
+GRADES_BY_SUBJECT = GRADE_ROWS.where(Subject.title.ilike(bindparam("pattern")))
+
+# --rf FILTER=VALUE ...: filter -> (column, converter of its values). Date
+# and grade take ranges; names take an exact value or a *PATTERN*, both
+# matched with ILIKE like every other name option (LIKE_SPECIAL characters
+# of an exact value are escaped).
+GRADE_FILTERS = {
+    "date": (Grade.date_of, lambda v: datetime.strptime(v, r"%Y-%m-%d").date()),
+    "grade": (Grade.grade, int),
+    "student": (Student.fullname, None),
+    "teacher": (Teacher.fullname, None),
+    "subject": (Subject.title, None),
+    "group": (Group.codename, None),
+}
+LIKE_SPECIAL = re.compile(r"[\\%_]")
+
+
+def parse_range(text: str, conv) -> tuple:
+    """'LOW..HIGH', 'LOW..', '..HIGH' or 'VALUE' -> (low, high), each
+    converted by CONV, None for an open end
+    """
+    low, sep, high = text.partition("..")
+    if not sep:
+        high = low
+    return (conv(low) if low else None, conv(high) if high else None)
+
+
+def grade_filters(arg_list: list) -> tuple[tuple, dict]:
+    """FILTER=VALUE arguments -> (forms, bind parameters) for grade_search()
+    """
+    forms, params = [], {}
+    for arg in arg_list:
+        name, sep, value = arg.partition("=")
+        if not sep or name not in GRADE_FILTERS:
+            raise ValueError(f"Wrong filter '{arg}'")
+        conv = GRADE_FILTERS[name][1]
+        if conv is not None:
+            low, high = parse_range(value, conv)
+            if low is not None:
+                forms.append((name, ">="))
+                params[f"{name}_low"] = low
+            if high is not None:
+                forms.append((name, "<="))
+                params[f"{name}_high"] = high
+        elif "*" in value:
+            forms.append((name, "like"))
+            params[name] = " ".join(value.split()).replace("*", "%")
+        else:
+            forms.append((name, "like"))
+            params[name] = LIKE_SPECIAL.sub(r"\\\g<0>",
+                                            " ".join(value.split()))
+    return tuple(sorted(set(forms))), params
+
+
+def date_range(arg: str) -> tuple[tuple, dict]:
+    """'YYYY-MM-DD', 'FROM..TO', 'FROM..' or '..TO' -> grade_filters() of
+    that date range; ValueError when ARG is none of them
+    """
+    forms, params = grade_filters([f"date={arg}"])
+    if not forms:
+        raise ValueError(f"Wrong date range '{arg}'")
+    return forms, params
+
+
+@functools.cache
+def grade_search(forms: tuple, ids: bool = False):
+    """GRADE_ROWS narrowed by FORMS ((filter, '>=' | '<=' | 'like'),
+    ...): only the filters given, one template per combination. With IDS:
+    just the grade ids in id order, joining only the tables filtered on.
+    """
+    names = { name for name, _ in forms }
+    if ids:
+        stmt = select(Grade.id).order_by(Grade.id)
+        if names & {"student", "group"}:
+            stmt = stmt.join(Student)
+        if "teacher" in names:
+            stmt = stmt.join(Teacher)
+        if "subject" in names:
+            stmt = stmt.join(Subject)
+    else:
+        stmt = GRADE_ROWS
+    if "group" in names:
+        stmt = stmt.join(Group, Student.group_id == Group.id)
+    for name, form in forms:
+        column = GRADE_FILTERS[name][0]
+        if form == ">=":
+            stmt = stmt.where(column >= bindparam(f"{name}_low"))
+        elif form == "<=":
+            stmt = stmt.where(column <= bindparam(f"{name}_high"))
+        else:
+            stmt = stmt.where(column.ilike(bindparam(name)))
+    return stmt
+
+# --limit / --after: read option -> (key column, id column, positions of
+# both in a result row, key from its cursor form). Students and grades have
+# (key, id) indexes (see the model): the (key, id) > (:k, :i) seek and the
+# order come from the index. Titles, codenames and teacher names have only
+# their single-column unique index. It seeks on key >= :k, and the row
+# comparison is rechecked as a filter. An Incremental Sort then adds id to
+# the order: the key is unique, so every sort group is one row, and LIMIT
+# still stops the scan early.
+PAGE_KEYS = {
+    "rS": (Subject.title, Subject.id, 1, 0, str),
+    "rG": (Group.codename, Group.id, 1, 0, str),
+    "rs": (Student.fullname, Student.id, 2, 0, str),
+    "rT": (Teacher.fullname, Teacher.id, 1, 0, str),
+    "rg": (Grade.date_of, Grade.id, 1, 0, date.fromisoformat),
+    "rf": (Grade.date_of, Grade.id, 1, 0, date.fromisoformat),
+}
+PAGE_LIMIT = 100        # rows of a page when only --after is given
+
+# Deletes go by id. The target ids are selected first (ORDERED BY id, so
+# concurrent purges lock rows in the same order), then rows referencing them
+# and the targets themselves are deleted a batch of ids at a time. Between
+# batches the transaction is committed when the caller allows it, keeping
+# locks and WAL bursts bounded.
+
+SUBJECT_IDS_LIKE = select(Subject.id) \
+        .where(Subject.title.ilike(bindparam("pattern"))).order_by(Subject.id)
+GROUP_IDS_LIKE = select(Group.id) \
+        .where(Group.codename.ilike(bindparam("pattern"))).order_by(Group.id)
+STUDENT_IDS_LIKE = select(Student.id) \
+        .where(Student.fullname.ilike(bindparam("pattern"))).order_by(Student.id)
+TEACHER_IDS_LIKE = select(Teacher.id) \
+        .where(Teacher.fullname.ilike(bindparam("pattern"))).order_by(Teacher.id)
+GRADE_IDS_BY_STUDENT = select(Grade.id).join(Student) \
+        .where(Student.fullname.ilike(bindparam("pattern"))).order_by(Grade.id)
+GRADE_IDS_BY_SUBJECT = select(Grade.id).join(Subject) \
+        .where(Subject.title.ilike(bindparam("pattern"))).order_by(Grade.id)
+
+IDS = bindparam("ids", type_=ARRAY(Integer))
+
+# model: [(child model, its foreign key column)], the rows to delete first
+DELETE_CHILDREN = {
+    Subject: [(Grade, Grade.subject_id),
+              (StudentSubject, StudentSubject.subject_id),
+              (TeacherSubject, TeacherSubject.subject_id)],
+    Teacher: [(Grade, Grade.teacher_id),
+              (TeacherSubject, TeacherSubject.teacher_id)],
+    Student: [(Grade, Grade.student_id),
+              (StudentSubject, StudentSubject.student_id)],
+    Group: [(Student, Student.group_id)],
+}
+CHILD_IDS = { fk: select(child.id).where(fk == any_(IDS)).order_by(child.id)
+              for children in DELETE_CHILDREN.values() for child, fk in children }
+DELETE_BY_IDS = { model: delete(model).where(model.id == any_(IDS))
+                                      .execution_options(synchronize_session=False)
+                  for model in (Subject, Group, Teacher, Student, Grade,
+                                StudentSubject, TeacherSubject) }
+
+DELETE_BATCH = 1000     # ids per DELETE statement (and transaction)
 
 TEACHER_DEGREE = ['проф.','д-р.','к.ф-м.н','PhD','к.т.н']
 
+COMMIT_EVERY = 1000     # --script operations per transaction
+
 def excm(msg: str):
     return "{{{ " + "..... EXCEPTION ....." + os.linesep + msg + os.linesep + "}}}"
 
+# Kinds of cached names a create/update/delete of an entity can change;
+# deleting a group deletes its students too
+INVALIDATES = {
+    "S": ("subject", "subjects"),
+    "G": ("group", "student"),
+    "s": ("student",),
+    "T": ("teacher",),
+}
+# The same, by the table a change feed reports
+CHANGED_KINDS = {
+    "subjects": ("subject", "subjects"),
+    "groups": ("group",),
+    "students": ("student",),
+    "teachers": ("teacher",),
+}
+
+# Tables a write option changes, deletes included with their cascade; their
+# TABLE_VERSIONS are bumped once its transaction is over
+WRITES = {
+    "cS": ("subjects",),
+    "cG": ("groups",),
+    "cs": ("students", "student_subjects"),
+    "cT": ("teachers", "teacher_subjects"),
+    "cg": ("grades",),
+    "uS": ("subjects",),
+    "uG": ("groups",),
+    "us": ("students", "student_subjects"),
+    "uT": ("teachers", "teacher_subjects"),
+    "dS": ("subjects", "grades", "student_subjects", "teacher_subjects"),
+    "dG": ("groups", "students", "grades", "student_subjects"),
+    "ds": ("students", "grades", "student_subjects"),
+    "dT": ("teachers", "grades", "teacher_subjects"),
+    "dg": ("grades",),
+    "import-grades": ("grades",),
+}
+
+# kind: (template, its bind parameter)
+ID_LOOKUPS = {
+    "group": (GROUP_ID_BY_CODENAME, "codename"),
+    "subject": (SUBJECT_ID_BY_TITLE, "title"),
+    "student": (STUDENT_ID_BY_FULLNAME, "fullname"),
+    "teacher": (TEACHER_ID_BY_FULLNAME, "fullname"),
+}
+
+async def lookup_id(session: AsyncSession, kind: str, name: str) -> int | None:
+    """Id of the KIND named like NAME; repeated names of the same invocation
+    come from the name cache
+    """
+    cache = name_cache(session)
+    found_id = cache.get(kind, name)
+    if found_id is None:
+        template, param = ID_LOOKUPS[kind]
+        row = (await session.execute(template.params({param: name}))).first()
+        if row is None:
+            return None
+        found_id, = row
+        cache.put(kind, name, found_id)
+    return found_id
+
+async def subject_ids(session: AsyncSession, titles: list) -> list | None:
+    """Ids of the subjects TITLES (case-insensitive) in one query. Logs every
+    missing title and returns None if there is any.
+    """
+    cache = name_cache(session)
+    names = list(dict.fromkeys(t.lower() for t in titles))
+    found = { name: cache.get("subjects", name) for name in names }
+    unknown = [ name for name, found_id in found.items() if found_id is None ]
+    if unknown:
+        stmt = SUBJECT_IDS_BY_TITLES.params(titles=unknown)
+        for subject_id, title in await session.execute(stmt):
+            found[title] = subject_id
+            cache.put("subjects", title, subject_id)
+    missing = [ t for t in titles if found[t.lower()] is None ]
+    if missing:
+        await logger.error("No such Subject(s): " +
+                           ", ".join(f"'{t}'" for t in missing))
+        return None
+    return [ found[name] for name in names ]
+
 async def insert_fake_objects(async_session: async_sessionmaker[AsyncSession]) -> None:
+    # Faker costs more to import and set up than all the rest of seed.py;
+    # only database init needs it
+    from faker import Faker
+    fake = Faker("uk_UA")
+
     async with async_session() as session:
         try:
             async with session.begin():
@@ -148,11 +450,7 @@ async def insert_fake_objects(async_session: async_sessionmaker[AsyncSession]) -
             await logger.error(excm(str(e)))
 
 async def async_init(fill_with_fakes: bool = True) -> None:
-    engine = create_async_engine(
-        f"postgresql+asyncpg://{CONF_PSUSER}:{CONF_PSPASS}"
-        f"@{CONF_PSHOST}:{CONF_PSPORT}/{CONF_PSNAME}",
-        echo=CONF_DGECHO,
-    )
+    engine = create_engine()
     # async_sessionmaker: a factory for new AsyncSession objects.
     # expire_on_commit - don't expire objects after transaction commit
     async_session = async_sessionmaker(engine, expire_on_commit=False)
@@ -181,6 +479,18 @@ async def async_init(fill_with_fakes: bool = True) -> None:
 
 ### Commnad Line Option Handlers ###
 
+def output(session: AsyncSession):
+    """Writer for the rows of an option: its own buffer when it runs
+    concurrently with other reads, else the invocation's one
+    """
+    return session.info.get("out", out)
+
+def diagnostics(session: AsyncSession):
+    """Logger of an option: a DeferredLogger when it runs concurrently with
+    other reads, else the invocation's one
+    """
+    return session.info.get("logger", logger)
+
 async def opt_cS(session: AsyncSession, arg_list: list):
     """Create SUBJECT
     """
@@ -213,35 +523,24 @@ async def opt_cs(session: AsyncSession, arg_list: list):
         await logger.error("Student must have ',' between lastname and name")
         return
     group = arg_list[1]
-    stmt = select(Group.id) \
-            .select_from(Group) \
-            .where(Group.codename.ilike(group))
-    result = await session.execute(stmt)
-    try:
-        group_id, = result.first()
-    except Exception:
+    group_id = await lookup_id(session, "group", group)
+    if group_id is None:
         await logger.error(f"No such Group '{group}'")
         return
 
+    subjects = await subject_ids(session, arg_list[2:])
+    if subjects is None:
+        return
+
     stmt = insert(Student) \
             .values(fullname=student, group_id=group_id)
     result = await session.execute(stmt)
     student_id, = result.inserted_primary_key
 
-    for subject in arg_list[2:]:
-        stmt = select(Subject.id) \
-                .select_from(Subject) \
-                .where(Subject.title.ilike(subject))
-        result = await session.execute(stmt)
-        try:
-            subject_id, = result.first()
-        except Exception:
-            await logger.error(f"No such Subject '{subject}'")
-            await session.rollback()
-            return
-
-        session.add(StudentSubject(  student_id=student_id
-                                   , subject_id=subject_id))
+    stmt = insert(StudentSubject) \
+            .values([ {"student_id": student_id, "subject_id": subject_id}
+                      for subject_id in subjects ])
+    await session.execute(stmt)
 
 async def opt_cT(session: AsyncSession, arg_list: list):
     """Create TEACHER SUBJECT1 SUBJECT2 ...
@@ -260,6 +559,10 @@ async def opt_cT(session: AsyncSession, arg_list: list):
                            f"degree '{', '.join(TEACHER_DEGREE)}'")
         return
 
+    subjects = await subject_ids(session, arg_list[1:])
+    if subjects is None:
+        return
+
     try:
         stmt = insert(Teacher) \
                 .values(fullname=teacher)
@@ -269,20 +572,10 @@ async def opt_cT(session: AsyncSession, arg_list: list):
         await logger.error(f"Teacher '{teacher}' cannot be added: {str(e)}")
         return
 
-    for subject in arg_list[1:]:
-        stmt = select(Subject.id) \
-                .select_from(Subject) \
-                .where(Subject.title.ilike(subject))
-        result = await session.execute(stmt)
-        try:
-            subject_id, = result.first()
-        except Exception:
-            await logger.error(f"No such Subject '{subject}'")
-            await session.rollback()
-            return
-
-        session.add(TeacherSubject(  teacher_id=teacher_id
-                                   , subject_id=subject_id))
+    stmt = insert(TeacherSubject) \
+            .values([ {"teacher_id": teacher_id, "subject_id": subject_id}
+                      for subject_id in subjects ])
+    await session.execute(stmt)
 
 async def opt_cg(session: AsyncSession, arg_list: list):
     """Create YYYY-MM-DD STUDENT 2..5 TEACHER SUBJECT
@@ -297,44 +590,29 @@ async def opt_cg(session: AsyncSession, arg_list: list):
 
     student = arg_list[1].split()
     student = " ".join(student)
-    stmt = select(Student.id) \
-            .select_from(Student) \
-            .where(Student.fullname.ilike(student))
-    result = await session.execute(stmt)
-    try:
-        student_id, = result.first()
-    except Exception:
+    student_id = await lookup_id(session, "student", student)
+    if student_id is None:
         await logger.error(f"No such student '{student}'")
         return
 
     try:
         grade = int(arg_list[2])
     except ValueError:
-        await logger.error(f"Wrong Grade '{grade}'. " + os.linesep +
+        await logger.error(f"Wrong Grade '{arg_list[2]}'. " + os.linesep +
                            "Usage: --cg DATE STUDENT 2..5 TEACHER SUBJECT")
         return
 
     teacher = arg_list[3].split()
     teacher = " ".join(teacher)
-    stmt = select(Teacher.id) \
-            .select_from(Teacher) \
-            .where(Teacher.fullname.ilike(teacher))
-    result = await session.execute(stmt)
-    try:
-        teacher_id, = result.first()
-    except Exception:
+    teacher_id = await lookup_id(session, "teacher", teacher)
+    if teacher_id is None:
         await logger.error(f"No such Teacher '{teacher}'")
         return
 
     subject = arg_list[4].split()
     subject = " ".join(subject)
-    stmt = select(Subject.id) \
-            .select_from(Subject) \
-            .where(Subject.title.ilike(subject))
-    result = await session.execute(stmt)
-    try:
-        subject_id, = result.first()
-    except Exception:
+    subject_id = await lookup_id(session, "subject", subject)
+    if subject_id is None:
         await logger.error(f"No such Subject '{subject}'")
         return
 
@@ -344,6 +622,37 @@ async def opt_cg(session: AsyncSession, arg_list: list):
                       , teacher_id=teacher_id
                       , subject_id=subject_id))
 
+async def read_page(session: AsyncSession, opt: str, template, fmt: str,
+                    **params) -> None:
+    """Stream TEMPLATE.params(**PARAMS). With session.info limit / after:
+    one keyset page of it, then the cursor of the next page is logged.
+    """
+    limit, after = session.info.get("limit"), session.info.get("after")
+    if after is not None and after[0] != opt:
+        after = None            # the cursor belongs to another read option
+    if limit is None and after is None:
+        await output(session).stream(session, template.params(**params), fmt)
+        return
+
+    key, id_col, key_at, id_at, load = PAGE_KEYS[opt]
+    stmt = keyset_page(template, key, id_col, after is not None)
+    params["limit"] = limit or PAGE_LIMIT
+    if after is not None:
+        params["after_key"], params["after_id"] = load(after[1]), after[2]
+    last = []
+
+    def remember(part):
+        if part:
+            last[:] = [part[-1]]
+        return part
+
+    count = await output(session).stream(session, stmt.params(**params), fmt,
+                                         transform=remember)
+    if count == params["limit"] and last:
+        output(session).flush()
+        cursor = encode_cursor(opt, last[0][key_at], last[0][id_at])
+        await diagnostics(session).info(f"Next page: --{opt} ... --after {cursor}")
+
 async def opt_rS(session: AsyncSession, arg_list: list):
     """Read *SUBJECT*SAMPLE*
     """
@@ -351,12 +660,7 @@ async def opt_rS(session: AsyncSession, arg_list: list):
     subject = " ".join(subject).replace(r"*", r"%")
     if subject == "":
         subject = r"%"
-    stmt = select(Subject.id, Subject.title) \
-            .select_from(Subject) \
-            .where(Subject.title.ilike(subject))
-    result = await session.execute(stmt)
-    for id, subject in result:
-        await logger.info("%2d | %s" % (id, subject))
+    await read_page(session, "rS", SUBJECTS_LIKE, "%2d | %s", pattern=subject)
 
 async def opt_rG(session: AsyncSession, arg_list: list):
     """Read *GROUP*SAMPLE*
@@ -365,12 +669,7 @@ async def opt_rG(session: AsyncSession, arg_list: list):
     group = " ".join(group).replace(r"*", r"%")
     if group == "":
         group = r"%"
-    stmt = select(Group.id, Group.codename) \
-            .select_from(Group) \
-            .where(Group.codename.ilike(group))
-    result = await session.execute(stmt)
-    for id, group in result:
-        await logger.info("%2d | %s" % (id, group))
+    await read_page(session, "rG", GROUPS_LIKE, "%2d | %s", pattern=group)
 
 async def opt_rs(session: AsyncSession, arg_list: list):
     """Read *STUDENT*SAMPLE*
@@ -379,13 +678,8 @@ async def opt_rs(session: AsyncSession, arg_list: list):
     student = " ".join(student).replace(r"*", r"%")
     if student == "":
         student = r"%"
-    stmt = select(Student.id, Group.codename, Student.fullname) \
-            .select_from(Student) \
-            .join(Group) \
-            .where(Group.codename.ilike(student))
-    result = await session.execute(stmt)
-    for id, group, student in result:
-        await logger.info("%2d | %7s | %-s" % (id, group, student))
+    await read_page(session, "rs", STUDENTS_LIKE, "%2d | %7s | %-s",
+                    pattern=student)
 
 async def opt_rT(session: AsyncSession, arg_list: list):
     """Read *TEACHER*SAMPLE*
@@ -394,82 +688,49 @@ async def opt_rT(session: AsyncSession, arg_list: list):
     teacher = " ".join(teacher).replace(r"*", r"%")
     if teacher == "":
         teacher = r"%"
-    stmt = select(Teacher.id, Teacher.fullname) \
-            .select_from(Teacher) \
-            .where(Teacher.fullname.ilike(teacher))
-    result = await session.execute(stmt)
-    for id, teacher in result:
-        await logger.info("%2d | %-s" % (id, teacher))
+    await read_page(session, "rT", TEACHERS_LIKE, "%2d | %-s", pattern=teacher)
 
 async def opt_rg(session: AsyncSession, arg_list: list):
-    """Read *STUDENT_OR_TEACHER_OR_SUBJECT*SAMPLE* | DATE
+    """Read *STUDENT_OR_TEACHER_OR_SUBJECT*SAMPLE* | DATE | FROM..TO
     """
     arg = " ".join(arg_list).split()
     arg = " ".join(arg).replace(r"*", r"%")
 
     try:
-        date_of = datetime.strptime(arg, r"%Y-%m-%d").date()
-        # Date
-        stmt = select(  Grade.id
-                      , Grade.date_of
-                      , Teacher.fullname
-                      , Student.fullname
-                      , Subject.title
-                      , Grade.grade) \
-                .select_from(Grade) \
-                .join(Teacher) \
-                .join(Student) \
-                .join(Subject) \
-                .where(Grade.date_of == date_of)
+        # Date or FROM..TO: a range scan of the date_of index
+        forms, params = date_range(arg)
+        template = grade_search(forms)
     except ValueError:
         for degree in TEACHER_DEGREE:
             if arg.lower().startswith(degree.lower()):
                 # Teacher
-                print(f"teacher '{arg}'")
-                stmt = select(  Grade.id
-                              , Grade.date_of
-                              , Teacher.fullname
-                              , Student.fullname
-                              , Subject.title
-                              , Grade.grade) \
-                        .select_from(Grade) \
-                        .join(Teacher) \
-                        .join(Student) \
-                        .join(Subject) \
-                        .where(Teacher.fullname.ilike(arg))
+                await diagnostics(session).info(f"Grades by Teacher '{arg}'")
+                template, params = GRADES_BY_TEACHER, {"pattern": arg}
                 break
         else:
             if arg.find(',') > 0:
                 # Student
-                stmt = select(  Grade.id
-                              , Grade.date_of
-                              , Teacher.fullname
-                              , Student.fullname
-                              , Subject.title
-                              , Grade.grade) \
-                        .select_from(Grade) \
-                        .join(Teacher) \
-                        .join(Student) \
-                        .join(Subject) \
-                        .where(Student.fullname.ilike(arg))
+                template, params = GRADES_BY_STUDENT, {"pattern": arg}
             else:
                 # Subject
-                stmt = select(  Grade.id
-                              , Grade.date_of
-                              , Teacher.fullname
-                              , Student.fullname
-                              , Subject.title
-                              , Grade.grade) \
-                        .select_from(Grade) \
-                        .join(Teacher) \
-                        .join(Student) \
-                        .join(Subject) \
-                        .where(Subject.title.ilike(arg))
+                template, params = GRADES_BY_SUBJECT, {"pattern": arg}
 
-    result = await session.execute(stmt)
-    for id, date_of, teacher, student, subject, grade in result:
-        await logger.info("%3d | %10s | %25s | %25s | %25s | %s" %
-                          (id, date_of, teacher, student, subject, grade))
+    await read_page(session, "rg", template,
+                    "%3d | %10s | %25s | %25s | %25s | %s", **params)
+
+async def opt_rf(session: AsyncSession, arg_list: list):
+    """Read grades matching every FILTER=VALUE: date=FROM..TO grade=LOW..HIGH
+    student=|teacher=|subject=|group=NAME or *SAMPLE*
+    """
+    try:
+        forms, params = grade_filters(arg_list)
+    except ValueError as e:
+        await diagnostics(session).error(
+            f"{e}. Usage: --rf date=2023-03-01..2023-03-31 grade=4..5 "
+            "student=*SAMPLE* teacher=... subject=... group=...")
+        return
+    await read_page(session, "rf", grade_search(forms),
+                    "%3d | %10s | %25s | %25s | %25s | %s", **params)
 
 async def opt_uS(session: AsyncSession, arg_list: list):
     """Update *SUBJECT*SAMPLE* NEW_SUBJECT_NAME"""
@@ -484,10 +745,10 @@ async def opt_uS(session: AsyncSession, arg_list: list):
             # .returning(Subject.id, Subject.title)
     try:
         result = await session.execute(stmt)
-    except Exception:
+    except IntegrityError:
+        # the caller rolls back: the whole run, or this line's savepoint
         await logger.info("Error updating: there are duplicates!")
-        await session.rollback()
-        return
+        raise
     # (id, title), = result
     await logger.info(f"Update {result.rowcount} entry(-ies)")
 
@@ -503,10 +764,10 @@ async def opt_uG(session: AsyncSession, arg_list: list):
             .values(codename=new_group)
     try:
         result = await session.execute(stmt)
-    except Exception:
+    except IntegrityError:
+        # the caller rolls back: the whole run, or this line's savepoint
         await logger.info("Error updating: there are duplicates!")
-        await session.rollback()
-        return
+        raise
     await logger.info(f"Update {result.rowcount} entry(-ies)")
 
 async def opt_us(session: AsyncSession, arg_list: list):
@@ -526,16 +787,15 @@ async def opt_us(session: AsyncSession, arg_list: list):
         await logger.error("New student name must have ',' between lastname and name")
         return
     group = arg_list[2]
-    stmt = select(Group.id) \
-            .select_from(Group) \
-            .where(Group.codename.ilike(group))
-    result = await session.execute(stmt)
-    try:
-        group_id, = result.first()
-    except Exception:
+    group_id = await lookup_id(session, "group", group)
+    if group_id is None:
         await logger.error(f"No such Group '{group}'")
         return
 
+    subjects = await subject_ids(session, arg_list[3:])
+    if subjects is None:
+        return
+
     stmt = update(Student) \
             .where(Student.fullname.ilike(student)) \
             .values(fullname=new_student, group_id=group_id) \
@@ -552,21 +812,10 @@ async def opt_us(session: AsyncSession, arg_list: list):
     stmt = delete(StudentSubject).where(StudentSubject.student_id == student_id)
     result = await session.execute(stmt)
 
-    for subject in arg_list[3:]:
-        stmt = select(Subject.id) \
-                .select_from(Subject) \
-                .where(Subject.title.ilike(subject))
-        result = await session.execute(stmt)
-
-        try:
-            (subject_id,), = result
-        except Exception:
-            await logger.error(f"No such Subject '{subject}'")
-            await session.rollback()
-            return
-
-        session.add(StudentSubject(  student_id=student_id
-                                   , subject_id=subject_id))
+    stmt = insert(StudentSubject) \
+            .values([ {"student_id": student_id, "subject_id": subject_id}
+                      for subject_id in subjects ])
+    await session.execute(stmt)
 
 async def opt_uT(session: AsyncSession, arg_list: list):
     """Update *TEACHER*SAMPLE* NEW_TEACHER_NAME SUBJECT1 SUBJECT2 ..."""
@@ -593,6 +842,10 @@ async def opt_uT(session: AsyncSession, arg_list: list):
                            ", ".join(TEACHER_DEGREE))
         return
 
+    subjects = await subject_ids(session, arg_list[2:])
+    if subjects is None:
+        return
+
     stmt = update(Teacher) \
             .where(Teacher.fullname.ilike(teacher)) \
             .values(fullname=new_teacher) \
@@ -609,24 +862,52 @@ async def opt_uT(session: AsyncSession, arg_list: list):
     stmt = delete(TeacherSubject).where(TeacherSubject.teacher_id == teacher_id)
     result = await session.execute(stmt)
 
-    for subject in arg_list[2:]:
-        stmt = select(Subject.id) \
-                .select_from(Subject) \
-                .where(Subject.title.ilike(subject))
-        result = await session.execute(stmt)
-
-        try:
-            (subject_id,), = result
-        except Exception:
-            await logger.error(f"No such Subject '{subject}'")
-            await session.rollback()
-            return
-
-        session.add(TeacherSubject(  teacher_id=teacher_id
-                                   , subject_id=subject_id))
+    stmt = insert(TeacherSubject) \
+            .values([ {"teacher_id": teacher_id, "subject_id": subject_id}
+                      for subject_id in subjects ])
+    await session.execute(stmt)
+
+async def delete_ids(session: AsyncSession, model, ids: list,
+                     counts: dict) -> None:
+    """Delete the rows IDS of MODEL, the rows referencing them first, in
+    id-ordered batches. COUNTS: table name -> rows deleted so far.
+    session.info: delete_batch (ids per statement), dry_run (only count),
+    commit_batches (commit after every batch: --commit-batches, and only
+    while no other kind of write is pending in the transaction).
+    """
+    batch_size = session.info.get("delete_batch", DELETE_BATCH)
+    dry_run = session.info.get("dry_run", False)
+    table = model.__tablename__
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        for child, fk in DELETE_CHILDREN.get(model, ()):
+            child_ids = (await session.scalars(CHILD_IDS[fk], {"ids": batch})).all()
+            await delete_ids(session, child, child_ids, counts)
+        if dry_run:
+            counts[table] = counts.get(table, 0) + len(batch)
+            continue
+        result = await session.execute(DELETE_BY_IDS[model], {"ids": batch})
+        counts[table] = counts.get(table, 0) + result.rowcount
+        if session.info.get("commit_batches"):
+            await session.commit()
+        if len(ids) > batch_size:
+            await logger.info(f"  {table}: {counts[table]} row(s) deleted")
+
+async def delete_where(session: AsyncSession, model, ids_stmt) -> None:
+    """Delete the rows of MODEL whose ids IDS_STMT selects (see delete_ids)
+    """
+    ids = (await session.scalars(ids_stmt)).all()
+    counts = {}
+    await delete_ids(session, model, ids, counts)
+    table = model.__tablename__
+    others = ", ".join(f"{n} {t}" for t, n in counts.items()
+                       if t != table and n)
+    verb = "Would delete" if session.info.get("dry_run") else "Deleted"
+    await logger.info(f"{verb} {counts.get(table, 0)} entry(-ies)"
+                      + (f" and {others}" if others else ""))
 
 async def opt_dS(session: AsyncSession, arg_list: list):
-    """Delete *SUBJECT*SAMPLE*"""
+    """Delete *SUBJECT*SAMPLE* (with its grades)"""
     subject = " ".join(arg_list).split()
     subject = " ".join(subject)
     await logger.info(f"Delete Subject '{subject}'")
@@ -634,12 +915,10 @@ async def opt_dS(session: AsyncSession, arg_list: list):
         raise ValueError("Absent subject name")
 
     subject = subject.replace(r'*', r'%')
-    stmt = delete(Subject).where(Subject.title.ilike(subject))
-    result = await session.execute(stmt)
-    await logger.info(f"Deleted {result.rowcount} entry(-ies)")
+    await delete_where(session, Subject, SUBJECT_IDS_LIKE.params(pattern=subject))
 
 async def opt_dG(session: AsyncSession, arg_list: list):
-    """Delete *GROUP*SAMPLE*"""
+    """Delete *GROUP*SAMPLE* (with its students and their grades)"""
     group = " ".join(arg_list).split()
     group = " ".join(group)
     await logger.info(f"Delete Group '{group}'")
@@ -647,12 +926,10 @@ async def opt_dG(session: AsyncSession, arg_list: list):
         raise ValueError("Absent group name")
 
     group = group.replace(r'*', r'%')
-    stmt = delete(Group).where(Group.codename.ilike(group))
-    result = await session.execute(stmt)
-    await logger.info(f"Deleted {result.rowcount} entry(-ies)")
+    await delete_where(session, Group, GROUP_IDS_LIKE.params(pattern=group))
 
 async def opt_ds(session: AsyncSession, arg_list: list):
-    """Delete *STUDENT*SAMPLE*"""
+    """Delete *STUDENT*SAMPLE* (with the student's grades)"""
     student = " ".join(arg_list).split()
     student = " ".join(student)
     await logger.info(f"Delete Student '{student}'")
@@ -660,12 +937,10 @@ async def opt_ds(session: AsyncSession, arg_list: list):
         raise ValueError("Absent student name")
 
     student = student.replace(r'*', r'%')
-    stmt = delete(Student).where(Student.fullname.ilike(student))
-    result = await session.execute(stmt)
-    await logger.info(f"Deleted {result.rowcount} entry(-ies)")
+    await delete_where(session, Student, STUDENT_IDS_LIKE.params(pattern=student))
 
 async def opt_dT(session: AsyncSession, arg_list: list):
-    """Delete *TEACHER*SAMPLE*"""
+    """Delete *TEACHER*SAMPLE* (with the grades given)"""
     teacher = " ".join(arg_list).split()
     teacher = " ".join(teacher)
     await logger.info(f"Delete Teacher '{teacher}'")
@@ -673,44 +948,188 @@ async def opt_dT(session: AsyncSession, arg_list: list):
         raise ValueError("Absent teacher name")
 
     teacher = teacher.replace(r'*', r'%')
-    stmt = delete(Teacher).where(Teacher.fullname.ilike(teacher))
-    result = await session.execute(stmt)
-    await logger.info(f"Deleted {result.rowcount} entry(-ies)")
+    await delete_where(session, Teacher, TEACHER_IDS_LIKE.params(pattern=teacher))
 
 async def opt_dg(session: AsyncSession, arg_list: list):
-    """Delete *STUDENT*SAMPLE* | DATE | *SUBJECT*SAMPLE*"""
+    """Delete *STUDENT*SAMPLE* | DATE | FROM..TO | *SUBJECT*SAMPLE*"""
     arg = " ".join(arg_list).split()
     arg = " ".join(arg)
     try:
-        date_of = datetime.strptime(arg, r"%Y-%m-%d").date()
-        await logger.info(f"Delete Grade by date '{arg}'")
-        stmt = delete(Grade).where(Grade.date_of == date_of)
-        result = await session.execute(stmt)
-        await logger.info(f"Deleted {result.rowcount} entry(-ies)")
-        return
+        forms, params = date_range(arg)
     except ValueError:
-        pass
-    except Exception as e:
-        await logger.error(f"Delete argument error: {str(e)}")
+        forms = None
+    if forms is not None:
+        await logger.info(f"Delete Grade by date '{arg}'")
+        await delete_where(session, Grade,
+                           grade_search(forms, ids=True).params(**params))
         return
 
     if arg.find(",") >= 0:
         await logger.info(f"Delete Grade by Student '{arg}'")
         arg = arg.replace(r'*', r'%')
-        stmt = delete(Grade) \
-            .where(Grade.student_id == Student.id) \
-            .where(Student.fullname.ilike(arg))
-        result = await session.execute(stmt)
-        await logger.info(f"Deleted {result.rowcount} entry(-ies)")
+        await delete_where(session, Grade, GRADE_IDS_BY_STUDENT.params(pattern=arg))
         return
 
     await logger.info(f"Delete Grade by Subject '{arg}'")
     arg = arg.replace(r'*', r'%')
-    stmt = delete(Grade) \
-        .where(Grade.subject_id == Subject.id) \
-        .where(Subject.title.ilike(arg))
-    result = await session.execute(stmt)
-    await logger.info(f"Deleted {result.rowcount} entry(-ies)")
+    await delete_where(session, Grade, GRADE_IDS_BY_SUBJECT.params(pattern=arg))
+
+### Database health: catalog and statistics views, no COUNT(*) ###
+
+async def opt_stats(session: AsyncSession, arg_list: list):
+    """Database health: estimated rows and sizes, index usage, dead tuples
+    and bloat, (auto)vacuum / analyze times, lock waits. A section that
+    would wait on a table lock longer than uni_stats.LOCK_TIMEOUT is skipped
+    """
+    from asyncpg import PostgresError
+
+    out = output(session)
+    tables = list(Base.metadata.tables)
+    # the run's later options keep their own lock_timeout
+    previous = (await session.execute(uni_stats.SHOW_LOCK_TIMEOUT)).scalar()
+    await session.execute(uni_stats.SET_LOCK_TIMEOUT.params(
+        value=uni_stats.LOCK_TIMEOUT))
+    reset = (await session.execute(uni_stats.STATS_RESET)).scalar()
+    out.line(f"Statistics since {reset}")
+    for title, stmt, fmt in uni_stats.SECTIONS:
+        out.line("")
+        out.line(title + ":")
+        shown = []
+
+        def with_header(part, fmt=fmt):
+            # text format: the column names above the first rows
+            if part and not shown:
+                out.line(fmt % part[0]._fields)
+                shown.append(True)
+            return part
+
+        try:
+            async with session.begin_nested():
+                count = await out.stream(session, stmt.params(tables=tables),
+                                         fmt, transform=with_header)
+        except (DBAPIError, PostgresError) as e:
+            # a server-side cursor raises the driver's own error
+            await diagnostics(session).warning(f"--stats: {title}: "
+                                               + excm(str(e)))
+            out.line("(skipped)")
+            continue
+        if not count:
+            out.line("(none)")
+    await session.execute(uni_stats.SET_LOCK_TIMEOUT.params(value=previous))
+
+
+### Bulk grade import: COPY into a staging table, validate and resolve in SQL ###
+
+IMPORT_COLUMNS = ["date_of", "student", "grade", "teacher", "subject"]
+
+IMPORT_STAGING = """
+CREATE TEMP TABLE grade_import (
+    record  integer GENERATED ALWAYS AS IDENTITY,
+    date_of text, student text, grade text, teacher text, subject text
+) ON COMMIT DROP
+"""
+
+# Names are matched case-insensitively against aggregated name tables, so
+# a name shared by several rows is reported as ambiguous, not duplicated.
+IMPORT_CHECK = r"""
+CREATE TEMP TABLE grade_import_checked ON COMMIT DROP AS
+SELECT gi.record, gi.date_of, gi.student, gi.grade, gi.teacher, gi.subject,
+       st.id AS student_id, tr.id AS teacher_id, sb.id AS subject_id,
+       concat_ws('; ',
+           CASE WHEN NOT CASE WHEN gi.date_of
+                              ~ '^\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])$'
+                         THEN substr(gi.date_of, 9, 2)::int <= extract(day FROM
+                                  date_trunc('month', (left(gi.date_of, 7) || '-01')::date)
+                                  + interval '1 month - 1 day')
+                         ELSE false END
+                THEN 'bad date' END,
+           CASE WHEN st.id IS NULL THEN 'no such student'
+                WHEN st.n > 1 THEN 'ambiguous student' END,
+           CASE WHEN NOT CASE WHEN gi.grade ~ '^\s*\d{1,2}\s*$'
+                         THEN btrim(gi.grade)::int BETWEEN 2 AND 5
+                         ELSE false END
+                THEN 'grade not in 2..5' END,
+           CASE WHEN tr.id IS NULL THEN 'no such teacher'
+                WHEN tr.n > 1 THEN 'ambiguous teacher' END,
+           CASE WHEN sb.id IS NULL THEN 'no such subject' END,
+           CASE WHEN tr.id IS NOT NULL AND sb.id IS NOT NULL
+                     AND NOT EXISTS (SELECT 1 FROM teacher_subjects ts
+                                     WHERE ts.teacher_id = tr.id
+                                       AND ts.subject_id = sb.id)
+                THEN 'teacher does not teach subject' END
+       ) AS reason
+FROM grade_import gi
+LEFT JOIN (SELECT lower(fullname) AS name, min(id) AS id, count(*) AS n
+           FROM students GROUP BY 1) st
+       ON st.name = lower(btrim(gi.student))
+LEFT JOIN (SELECT lower(fullname) AS name, min(id) AS id, count(*) AS n
+           FROM teachers GROUP BY 1) tr
+       ON tr.name = lower(btrim(gi.teacher))
+LEFT JOIN (SELECT lower(title) AS name, min(id) AS id
+           FROM subjects GROUP BY 1) sb
+       ON sb.name = lower(btrim(gi.subject))
+"""
+
+IMPORT_INSERT = """
+INSERT INTO grades (date_of, grade, student_id, subject_id, teacher_id)
+SELECT date_of::date, btrim(grade)::smallint, student_id, subject_id, teacher_id
+FROM grade_import_checked
+WHERE reason = ''
+ORDER BY record
+"""
+
+IMPORT_REJECTS = """
+SELECT record, date_of, student, grade, teacher, subject, reason
+FROM grade_import_checked
+WHERE reason <> ''
+ORDER BY record
+"""
+
+async def opt_import_grades(session: AsyncSession, arg_list: list):
+    """Import grades from FILE.csv: header line, then
+    DATE,STUDENT,GRADE,TEACHER,SUBJECT per line (UTF-8)
+    """
+    from asyncpg import BadCopyFileFormatError, PostgresError
+
+    path = Path(arg_list[0])
+    if not path.is_file():
+        await logger.error(f"No such file '{path}'")
+        return
+    rejects_path = path.with_suffix(".rejects.csv")
+    await logger.info(f"Import Grades from '{path}'")
+
+    conn = await session.connection()
+    await conn.exec_driver_sql("DROP TABLE IF EXISTS grade_import_checked")
+    await conn.exec_driver_sql("DROP TABLE IF EXISTS grade_import")
+    await conn.exec_driver_sql(IMPORT_STAGING)
+    raw = await conn.get_raw_connection()
+    try:
+        # a malformed file fails the COPY: only back to the savepoint, the
+        # options before this one are kept
+        async with conn.begin_nested():
+            status = await raw.driver_connection.copy_to_table(
+                "grade_import", source=path, columns=IMPORT_COLUMNS,
+                format="csv", header=True)
+    except (PostgresError, OSError) as e:
+        line = re.search(r"\bline (\d+)", getattr(e, "context", None) or "")
+        where = f", line {line[1]}" if line else ""
+        hint = " (quote a field that holds a comma: \"Last, First\")" \
+            if isinstance(e, BadCopyFileFormatError) else ""
+        await logger.error(f"Cannot import '{path}'{where}: {e}{hint}")
+        return
+    await logger.info(f"Staged {status.split()[-1]} row(s)")
+
+    await conn.exec_driver_sql(IMPORT_CHECK)
+    result = await conn.exec_driver_sql(IMPORT_INSERT)
+    await logger.info(f"Imported {result.rowcount} grade(s)")
+
+    rejected = await raw.driver_connection.copy_from_query(
+        IMPORT_REJECTS, output=rejects_path, format="csv", header=True)
+    rejected = int(rejected.split()[-1])
+    if rejected:
+        await logger.warning(f"Rejected {rejected} row(s), see '{rejects_path}'")
+    else:
+        rejects_path.unlink()
 
 options = \
 {   "cS": (opt_cS, 1, "Create SUBJECT")
@@ -723,7 +1142,11 @@ options = \
 ,   "rG": (opt_rG, '*', "Read *GROUP*SAMPLE*")
 ,   "rs": (opt_rs, '*', "Read *STUDENT*SAMPLE*")
 ,   "rT": (opt_rT, '*', "Read *TEACHER*SAMPLE*")
-,   "rg": (opt_rg, 1, "Read *STUDENT_OR_TEACHER_OR_SUBJECT*SAMPLE* | DATE")
+,   "rg": (opt_rg, 1, "Read *STUDENT_OR_TEACHER_OR_SUBJECT*SAMPLE* | DATE "
+                      "| FROM..TO")
+,   "rf": (opt_rf, '+', "Read grades matching all of date=FROM..TO "
+                        "grade=LOW..HIGH student= teacher= subject= group= "
+                        "(NAME or *SAMPLE*)")
 
 ,   "uS": (opt_uS, 2, "Update *SUBJECT*SAMPLE* NEW_SUBJECT_NAME")
 ,   "uG": (opt_uG, 2, "Update *GROUP*SAMPLE* NEW_GROUP_NAME")
@@ -736,34 +1159,378 @@ options = \
 ,   "dG": (opt_dG, 1, "Delete *GROUP*SAMPLE*")
 ,   "ds": (opt_ds, 1, "Delete *STUDENT*SAMPLE*")
 ,   "dT": (opt_dT, 1, "Delete *TEACHER*SAMPLE*")
-,   "dg": (opt_dg, 1, "Delete *STUDENT*SAMPLE* | DATE | *SUBJECT*SAMPLE*")
+,   "dg": (opt_dg, 1, "Delete *STUDENT*SAMPLE* | DATE | FROM..TO "
+                      "| *SUBJECT*SAMPLE*")
+
+,   "stats": (opt_stats, 0,
+              "Database health: estimated rows, table/index/TOAST sizes, "
+              "index usage, dead tuples and bloat, last (auto)vacuum and "
+              "(auto)analyze, lock waits")
+
+,   "import-grades": (opt_import_grades, 1,
+                      "Import grades from FILE.csv (DATE,STUDENT,GRADE,TEACHER,"
+                      "SUBJECT after a header line; quote a field that holds "
+                      "a comma: \"Last, First\"); rejected rows with the "
+                      "reason go to FILE.rejects.csv")
 }
 
-async def async_handle_options(ordered) -> None:
-    engine = create_async_engine(
-        f"postgresql+asyncpg://{CONF_PSUSER}:{CONF_PSPASS}"
-        f"@{CONF_PSHOST}:{CONF_PSPORT}/{CONF_PSNAME}",
-        echo=CONF_DGECHO,
-    )
+async def async_handle_options(ordered, reports=(),
+                               compile_stats: bool = False,
+                               script: str | None = None,
+                               commit_every: int = COMMIT_EVERY,
+                               settings: dict | None = None,
+                               metrics: str | None = None) -> None:
+    engine = create_engine()
+    stats = CompileStats(engine) if compile_stats else None
+    router = Router.from_config(engine, logger=logger)
+    names = NameCache()
+    if metrics is not None:
+        instrument(router)
+
+    await run_options(router, ordered, reports, names, settings)
+    if script is not None:
+        await run_script(router, script, commit_every, names, settings)
+
+    if stats is not None:
+        await logger.info(stats.summary())
+        await logger.info(names.summary())
+    if metrics is not None:
+        await write_metrics(metrics)
+
+    # for AsyncEngine created in function scope, close and
+    # clean-up pooled connections
+    await router.dispose()
+
+
+def instrument(router) -> None:
+    """Statement timings of the engines of ROUTER, see uni_metrics.py
+    """
+    collector = uni_metrics.metrics(load_config()["slow_ms"])
+    for engine in (router.primary, router.replica):
+        if engine is not None:
+            collector.attach(engine)
+
+
+async def write_metrics(path: str) -> None:
+    uni_metrics.METRICS.write(path)
+    await logger.info(uni_metrics.METRICS.summary())
+    await logger.info(f"Metrics written to '{path}'")
+
+
+async def run_options(router, ordered, reports=(), names=None,
+                      settings: dict | None = None,
+                      results: ResultCache | None = None) -> None:
+    """Run the ORDERED options in one transaction, then the REPORTS
+    ('01'..'12'). NAMES is the name cache the sessions share, SETTINGS go
+    to session.info (see option_settings()), RESULTS caches the reports.
+    With --commit-batches a delete commits after each of its batches, but
+    only until another kind of write has run: that one is all or nothing
+    with the rest of the run.
+    """
+    engine = router.primary
+    info = dict(settings or {})
+    pending = None
+    if names is not None:
+        info["name_cache"] = pending = PendingNames(names)
     # async_sessionmaker: a factory for new AsyncSession objects.
     # expire_on_commit - don't expire objects after transaction commit
-    async_session = async_sessionmaker(engine, expire_on_commit=False)
+    async_session = async_sessionmaker(engine, expire_on_commit=False,
+                                       info=info)
+
+    # --r? options go to the replica, but only until the first write: the
+    # reads after it must see this invocation's (uncommitted) changes. So do
+    # the reports after a write: the replica may not have replayed the
+    # commit yet. Reports that go into RESULTS are read on the primary too:
+    # a write bumps TABLE_VERSIONS when the primary commits it, and a lagging
+    # replica would get its old rows cached under the new versions.
+    first_write = next((n for n, (opt, _) in enumerate(ordered, 1)
+                        if not opt.startswith("r")), len(ordered) + 1)
+    writes = first_write <= len(ordered)
+    replica_reports = reports and not writes and results is None
+    reader = await router.reader() \
+        if first_write > 1 or replica_reports else engine
+    read_session = async_sessionmaker(reader, expire_on_commit=False,
+                                      info=info)
+    report_session = read_session if replica_reports else \
+        async_sessionmaker(engine, expire_on_commit=False, info=info)
+
+    # Those leading reads see no uncommitted writes, so two or more of them
+    # run concurrently, each on its own pooled connection. Plans of
+    # --explain are taken one at a time, undisturbed.
+    done = 0
+    if first_write > 2 and out.format != "explain":
+        done = first_write - 1
+        try:
+            await read_concurrently(read_session, reader.pool.size(),
+                                    ordered[:done])
+        except (ObjectNotExecutableError, ProgrammingError, DBAPIError) as e:
+            router.failed(reader, e)
+            await logger.warning(excm(str(e)))
+            done = len(ordered)
+        except ConnectionRefusedError as e:
+            router.failed(reader, e)
+            await logger.error(excm(str(e)))
+            return
 
+    # names this transaction may change; a shared cache drops them again
+    # once it is over, committed or not. What it resolves stays in PENDING
+    # until it commits.
+    touched, written = set(), set()
     try:
-        async with async_session() as session:
-            async with session.begin():
-                for opt, arg_list in ordered:
-                    await logger.info(f"Handle '--{opt} {' '.join(arg_list)}'")
-                    await options[opt][0](session, arg_list)
+        # closing the session rolls back what is not committed yet
+        async with async_session() as session, read_session() as rsession:
+            for n, (opt, arg_list) in enumerate(ordered[done:], done + 1):
+                await logger.info(f"Handle '--{opt} {' '.join(arg_list)}'")
+                out.label = f"{n:02d}-{opt}"
+                target = rsession \
+                    if n < first_write and reader is not engine else session
+                if opt in WRITES and not opt.startswith("d"):
+                    # a later delete's batch commit would commit this too
+                    session.info["commit_batches"] = False
+                await options[opt][0](target, arg_list)
+                if opt[0] in "cud":
+                    touched.update(INVALIDATES.get(opt[1:], ()))
+                    name_cache(session).forget(INVALIDATES.get(opt[1:], ()))
+                written.update(WRITES.get(opt, ()))
+                out.flush()
+            await session.commit()
+            if pending is not None:
+                pending.merge()
     except (ObjectNotExecutableError, ProgrammingError, DBAPIError) as e:
+        router.failed(reader, e)
         await logger.warning(excm(str(e)))
     except ConnectionRefusedError as e:
+        router.failed(reader, e)
         await logger.error(excm(str(e)))
         return
+    finally:
+        if names is not None:
+            names.forget(touched)
+        # committed or not: batched deletes may have committed a part
+        TABLE_VERSIONS.bump(written)
 
-    # for AsyncEngine created in function scope, close and
-    # clean-up pooled connections
-    await engine.dispose()
+    for nn in reports:
+        await run_report(nn, report_session, results)
+        out.flush()
+
+
+@functools.cache
+def report_tables(report) -> tuple:
+    """Names of the tables the statement template of REPORT reads
+    """
+    return tuple(sorted({ element.name
+                          for element in visitors.iterate(report.statement())
+                          if element.__visit_name__ == "table" }))
+
+
+async def run_report(nn: str, read_session, results=None) -> None:
+    """Report uni-select-NN. With RESULTS, its rendered rows are cached
+    until a write bumps one of the tables it reads or the entry expires;
+    READ_SESSION must then be on the primary (see run_options()).
+    """
+    report = __import__(f"uni-select-{nn}")
+    report.logger, report.out = logger, out
+    await logger.info(f"Report uni-select-{nn}")
+    out.label = f"uni-select-{nn}"
+    select_nn = getattr(report, f"select_{nn}")
+    if results is None or out.format == "explain":
+        try:
+            await select_nn(read_session)
+        except (ProgrammingError, DBAPIError) as e:
+            await logger.warning(excm(str(e)))
+        return
+
+    key, tables = (nn, out.format), report_tables(report)
+    data = results.get(key, tables)
+    if data is not None:
+        await logger.info(f"Report uni-select-{nn} (cached)")
+        out.write_bytes(data)
+        return
+
+    # versions before the read: a write that commits during it makes the
+    # entry stale at once
+    snapshot = results.versions.snapshot(tables)
+    buffer = out.buffered()
+
+    async def fill():
+        # the task has a copy of the request context: rebinding `out` there
+        # sends the report's rows to BUFFER only
+        uni_daemon.bind(uni_daemon.resolve(logger), buffer)
+        await select_nn(read_session)
+
+    try:
+        await asyncio.create_task(fill())
+    except (ProgrammingError, DBAPIError) as e:
+        await logger.warning(excm(str(e)))
+    else:
+        data = buffer.getvalue()
+        results.put(key, snapshot, data)
+        out.write_bytes(data)
+
+
+class DeferredLogger:
+    """Diagnostics of a read that runs concurrently with others, kept with
+    the position in its row buffer they were logged at
+    """
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.calls = []
+
+    async def info(self, msg: str) -> None:
+        self.record("info", msg)
+
+    async def warning(self, msg: str) -> None:
+        self.record("warning", msg)
+
+    async def error(self, msg: str) -> None:
+        self.record("error", msg)
+
+    def record(self, level: str, msg: str) -> None:
+        self.calls.append((level, msg, len(self.buffer.getvalue())))
+
+    async def replay(self) -> None:
+        """Write the buffered rows to `out` with the diagnostics between
+        them, as a sequential run would
+        """
+        data, start = self.buffer.getvalue(), 0
+        for level, msg, end in self.calls:
+            out.write_bytes(data[start:end])
+            out.flush()
+            await getattr(logger, level)(msg)
+            start = end
+        out.write_bytes(data[start:])
+        out.flush()
+
+
+async def read_concurrently(read_session, limit: int, batch: list) -> None:
+    """Run the read options of BATCH [(opt, arg_list)] at the same time, at
+    most LIMIT at once; their diagnostics and rows are printed in BATCH order.
+    A failing read cancels the others; as in a sequential run, the reads
+    before it are printed and then its error is raised.
+    """
+    slots = asyncio.Semaphore(limit)
+    deferred = [None] * len(batch)
+
+    async def read(n: int):
+        opt, arg_list = batch[n]
+        logged = deferred[n] = DeferredLogger(out.buffered())
+        async with slots, read_session() as session:
+            session.info["out"], session.info["logger"] = logged.buffer, logged
+            await logged.info(f"Handle '--{opt} {' '.join(arg_list)}'")
+            await options[opt][0](session, arg_list)
+
+    tasks = []
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [ group.create_task(read(n)) for n in range(len(batch)) ]
+    except ExceptionGroup:
+        pass    # the first failing read in BATCH order is raised below
+
+    for n, task in enumerate(tasks):
+        if task.cancelled():
+            # a later read failed first: this one runs on its own now
+            try:
+                await read(n)
+                error = None
+            except Exception as e:
+                error = e
+        else:
+            error = task.exception()
+        # a failing read's rows and diagnostics up to its error too
+        await deferred[n].replay()
+        if error is not None:
+            raise error
+
+
+class ScriptParser(argparse.ArgumentParser):
+    """Parser of one --script line: errors are raised, not exited on
+    """
+    def error(self, message):
+        raise ValueError(message)
+
+
+def script_parser() -> ScriptParser:
+    parser = ScriptParser(prog="--script", add_help=False)
+    add_option_flags(parser)
+    return parser
+
+
+async def run_script(router, path: str, commit_every: int = COMMIT_EVERY,
+                     names=None, settings: dict | None = None) -> None:
+    """Run the operations of script PATH ('-' is stdin) line by line, each
+    in a savepoint, and commit every COMMIT_EVERY operations. A failed
+    operation is logged and skipped, the rest goes on.
+    """
+    # deletes do not commit their batches here: a savepoint is open
+    info = {**(settings or {}), "commit_batches": False}
+    cache = None
+    if names is not None:
+        info["name_cache"] = cache = PendingNames(names)
+    async_session = async_sessionmaker(router.primary, expire_on_commit=False,
+                                       info=info)
+    parser = script_parser()
+    done = failed = pending = 0
+    touched, written = set(), set()
+    file = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        async with async_session() as session:
+            for number, line in enumerate(file, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                try:
+                    ordered = getattr(parser.parse_args(shlex.split(line)),
+                                      "ordered", [])
+                except ValueError as e:
+                    await logger.error(f"{path}:{number}: {e}")
+                    failed += 1
+                    continue
+                for opt, arg_list in ordered:
+                    out.label = f"{number:02d}-{opt}"
+                    try:
+                        async with session.begin_nested():
+                            await options[opt][0](session, arg_list)
+                        done += 1
+                    except (ValueError, ProgrammingError, DBAPIError) as e:
+                        await logger.error(f"{path}:{number}: --{opt}: "
+                                           + excm(str(e)))
+                        failed += 1
+                    except ConnectionRefusedError:
+                        raise
+                    except Exception as e:
+                        # a bug in one option skips its row, not the script
+                        await logger.error(f"{path}:{number}: --{opt}: {e!r}")
+                        failed += 1
+                    if opt[0] in "cud":
+                        touched.update(INVALIDATES.get(opt[1:], ()))
+                        name_cache(session).forget(INVALIDATES.get(opt[1:], ()))
+                    written.update(WRITES.get(opt, ()))
+                    pending += 1
+                if pending >= commit_every:
+                    await session.commit()
+                    if cache is not None:
+                        cache.merge()
+                    TABLE_VERSIONS.bump(written)
+                    written.clear()
+                    out.flush()
+                    await logger.info(f"{path}:{number}: committed, "
+                                      f"{done} done, {failed} failed")
+                    pending = 0
+            await session.commit()
+            if cache is not None:
+                cache.merge()
+    except ConnectionRefusedError as e:
+        await logger.error(excm(str(e)))
+        return
+    finally:
+        if file is not sys.stdin:
+            file.close()
+        if names is not None:
+            names.forget(touched)
+        TABLE_VERSIONS.bump(written)
+    out.flush()
+    await logger.info(f"Script '{path}': {done} operation(s) done, "
+                      f"{failed} failed")
 
 
 class ActionOrdered(argparse.Action):
@@ -774,26 +1541,166 @@ class ActionOrdered(argparse.Action):
         previous.append((self.dest, values))
         setattr(namespace, 'ordered', previous)
 
-def handle_options():
+NAME_CACHE_TTL = 60.0      # seconds a daemon trusts a cached name
+
+
+def add_option_flags(parser) -> None:
+    for opt, how in options.items():
+        parser.add_argument(f"--{opt}", metavar='o', nargs=how[1], help=how[2],
+                            dest=opt, action=ActionOrdered)
+
+
+def cursor(value: str) -> tuple:
+    try:
+        return decode_cursor(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="CRUD For UNI Database. "
                                      "Student name must have ',' ('Петренко, Тарас'). "
                                      "Teacher name must start with: "
                                      + ", ".join(TEACHER_DEGREE) + ".")
-    for opt, how in options.items():
-        parser.add_argument(f"--{opt}", metavar='o', nargs=how[1], help=how[2],
-                            action=ActionOrdered)
+    add_option_flags(parser)
+    parser.add_argument("--script", metavar="FILE", default=None,
+                        help="Run the operations of FILE ('-' is stdin), one "
+                             "or more per line written as on the command "
+                             "line, after the other options. Each one is "
+                             "undone alone when it fails.")
+    parser.add_argument("--commit-every", metavar="N", type=int,
+                        default=COMMIT_EVERY,
+                        help=f"--script commits after every N operations "
+                             f"(default: {COMMIT_EVERY})")
+    parser.add_argument("--delete-batch", metavar="N", type=int,
+                        default=DELETE_BATCH,
+                        help=f"Delete options remove N rows per statement "
+                             f"(default: {DELETE_BATCH})")
+    parser.add_argument("--commit-batches", action="store_true",
+                        help="Delete options commit after every batch, as "
+                             "long as no create, update or import ran before "
+                             "them. A failure leaves a partial purge.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Delete options only count the rows they would "
+                             "delete")
+    parser.add_argument("--limit", metavar="N", type=int, default=None,
+                        help="Read options print at most N rows, in key "
+                             "order, and log the cursor of the next page")
+    parser.add_argument("--after", metavar="CURSOR", type=cursor, default=None,
+                        help="Continue the read option that logged CURSOR "
+                             f"(default page: {PAGE_LIMIT} rows)")
+    parser.add_argument("--report", metavar="NN", action="append",
+                        choices=[ f"{n:02d}" for n in range(1, 13) ],
+                        help="Run report uni-select-NN.py after the options "
+                             "(may be repeated)")
+    add_output_options(parser)
+    add_profile_options(parser)
+    parser.add_argument("--compile-stats", action="store_true",
+                        help="Log how often SQL was compiled and how often "
+                             "the compiled cache was hit")
+    parser.add_argument("--metrics", metavar="FILE", default=None,
+                        help="Time every statement; at the end log a summary "
+                             "and write the timings to FILE (JSON for *.json, "
+                             "else Prometheus text). Through --via: the "
+                             "daemon's timings since it started")
+    parser.add_argument("--serve", metavar="SOCKET", default=None,
+                        help="Run as a daemon on the Unix socket SOCKET: one "
+                             "warm connection pool and name cache serve "
+                             "every --via client")
+    parser.add_argument("--via", metavar="SOCKET", default=None,
+                        help="Thin client: have the daemon on SOCKET run the "
+                             "other options")
+    return parser
+
+
+def option_settings(args) -> dict:
+    """session.info entries the option handlers read
+    """
+    return {"delete_batch": args.delete_batch, "dry_run": args.dry_run,
+            "commit_batches": args.commit_batches,
+            "limit": args.limit, "after": args.after}
+
+
+async def serve(path: str) -> None:
+    """seed.py --serve: options and reports of every request run on one
+    engine; the module's logger and out are bound to the request. The
+    caches also drop what the change feed reports changed by other clients.
+    """
+    engine = create_engine()
+    stats = CompileStats(engine)
+    router = Router.from_config(engine, logger=daemon_logger)
+    names = NameCache(ttl=NAME_CACHE_TTL)
+    results = ResultCache()
+    instrument(router)
+    parser = build_parser()
+    feed = ChangeFeed(engine, CHANGE_CHANNEL, daemon_logger)
+    feed.subscribe(TABLE_VERSIONS.bump)
+    feed.subscribe(lambda changes: names.forget(
+        { kind for table in changes for kind in CHANGED_KINDS.get(table, ()) }))
+
+    async def handle(argv: list, writer) -> int:
+        args = uni_daemon.parse_args(parser, argv)
+        if args.serve or args.via or args.profile:
+            raise uni_daemon.RequestExit(2, "--serve, --via and --profile "
+                                            "are not for the daemon")
+        if "ordered" not in args and not args.report and not args.script \
+                and not args.metrics:
+            raise uni_daemon.RequestExit(2, "Nothing to do")
+        if args.script == "-":
+            raise uni_daemon.RequestExit(2, "--script - reads the daemon's "
+                                            "stdin: give a FILE")
+        binary = not args.explain and WRITERS[args.format].binary
+        request_logger = uni_daemon.RequestLogger(writer)
+        request_out = open_writer(args.format, explain=args.explain,
+                                  file=uni_daemon.client_file(writer, binary),
+                                  drain=request_logger.drain)
+        uni_daemon.bind(request_logger, request_out)
+        try:
+            await run_options(router, getattr(args, "ordered", []),
+                              args.report or (), names, option_settings(args),
+                              results)
+            if args.script is not None:
+                await run_script(router, args.script, args.commit_every, names,
+                                 option_settings(args))
+            if args.compile_stats:
+                await logger.info(stats.summary())
+                await logger.info(names.summary())
+                await logger.info(results.summary())
+                await logger.info(feed.summary())
+            if args.metrics is not None:
+                await write_metrics(args.metrics)
+        finally:
+            request_out.close()
+        return 0
+
+    feed.start()
+    try:
+        await uni_daemon.serve(path, handle, daemon_logger)
+    finally:
+        await feed.close()
+        await router.dispose()
 
-    args = parser.parse_args()
 
-    if "ordered" not in args:
+def handle_options():
+    args = build_parser().parse_args()
+
+    global logger, out, daemon_logger
+    if args.serve:
+        daemon_logger = logger
+        logger = uni_daemon.ContextProxy(uni_daemon.current_logger)
+        out = uni_daemon.ContextProxy(uni_daemon.current_out)
+        run(serve(args.serve), profiler(args, "seed-serve"))
+        return
+
+    if "ordered" not in args and not args.report and not args.script:
         try:
             match (input("Init database ? [Y-fill with fake data|C-only init|N] ")
                          or "N") \
                     .strip()[0].upper():
                 case "Y":
-                    asyncio.run(async_init(fill_with_fakes=True))
+                    run(async_init(fill_with_fakes=True))
                 case "C":
-                    asyncio.run(async_init(fill_with_fakes=False))
+                    run(async_init(fill_with_fakes=False))
                 case "N":
                     print("N")
                 case _:
@@ -801,44 +1708,19 @@ def handle_options():
         except (KeyboardInterrupt, EOFError):
             print()
         return
-    
-    asyncio.run(async_handle_options(args.ordered))
 
-def overview_config():
-    global CONF_PSNAME, CONF_PSHOST, CONF_PSPORT, CONF_PSUSER, CONF_PSPASS
-    global CONF_DGECHO
-    try:
-        conf = ConfigParser()
-        confpathfile = Path(__file__)
-        confpathfile = confpathfile.parent / "config.ini"
-        conf.read(confpathfile)
-        conf_postgresql, conf_debug = "", ""
-        for s in conf.sections():
-            ss = s.strip().upper()
-            if "POSTGRESQL" == ss:
-                conf_postgresql = s
-            elif "DEBUG" == ss:
-                conf_debug = s
-        if not conf_postgresql or not conf_debug:
-            raise SyntaxError("Absent needed sections")
-        CONF_PSNAME, CONF_PSHOST, CONF_PSPORT, CONF_PSUSER, CONF_PSPASS = \
-            conf.get(conf_postgresql, "NAME"), \
-            conf.get(conf_postgresql, "HOST"), \
-            conf.get(conf_postgresql, "PORT"), \
-            conf.get(conf_postgresql, "USER"), \
-            conf.get(conf_postgresql, "PASS")
-        CONF_DGECHO = conf.get(conf_debug, "ECHO")
-        if CONF_DGECHO.isdigit() and int(CONF_DGECHO):
-            CONF_DGECHO = True
-        else:
-            CONF_DGECHO = False
-    except Exception as e:
-        print(f"Config file ('{confpathfile}'): {str(e)}")
-        exit(1)
+    logger = diagnostics_logger(args.format, args.out)
+    out = open_writer(args.format, args.out, args.explain)
+    profile = profiler(args, "seed", logger)
+    if profile is not None:
+        for opt, (handler, *rest) in options.items():
+            options[opt] = (profile.timed(handler, "option", f"--{opt}"), *rest)
+    run(async_handle_options(getattr(args, "ordered", []), args.report or (),
+                             args.compile_stats, args.script, args.commit_every,
+                             option_settings(args), args.metrics), profile)
+    out.close()
 
 if __name__ == "__main__":
-    if platform.system() == 'Windows':
-        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-    overview_config()
+    load_config()
     logger = Logger.with_default_handlers(name='NoPrintLogger')
     handle_options()
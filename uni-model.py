@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from sqlalchemy import UniqueConstraint, CheckConstraint
+from sqlalchemy import UniqueConstraint, CheckConstraint, Index
+from sqlalchemy import DDL, event
 from sqlalchemy import ForeignKey, Integer, SmallInteger, String, Date
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase
@@ -8,6 +9,8 @@ from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
 from sqlalchemy.orm import relationship, backref
 
+from uni_notify import NOTIFY_FUNCTION_SQL, trigger_sql
+
 
 class Base(AsyncAttrs, DeclarativeBase):
     pass
@@ -71,6 +74,9 @@ class Student(Base):
                                           ForeignKey('groups.id', ondelete="CASCADE"))
     group = relationship("Group", cascade="all, delete",
                          backref=backref("student_groups", cascade="all, delete"))
+    # keyset pagination of seed.py --rs ... --limit N; grade search by group
+    __table_args__ = (Index("student_fullname_id", fullname, id),
+                      Index("student_group_id", group_id))
 
 class TeacherSubject(Base):
     """
@@ -172,4 +178,24 @@ class Grade(Base):
     teacher = relationship('Teacher', cascade="all, delete",
                            backref=backref("grade_teachers",
                                            cascade="all, delete"))
-    __table_args__ = (CheckConstraint("2 <= grade AND grade <= 5"),)
+    # keyset pagination of seed.py --rg ... --limit N; grade search (--rf)
+    # by student, subject or teacher within a date range
+    __table_args__ = (CheckConstraint("2 <= grade AND grade <= 5"),
+                      Index("grade_date_of_id", date_of, id),
+                      Index("grade_student_date_of", student_id, date_of),
+                      Index("grade_subject_date_of", subject_id, date_of),
+                      Index("grade_teacher_date_of", teacher_id, date_of))
+
+
+#{{{ Change feed
+
+# Every statement that changes one of these tables is NOTIFY-ed on
+# CHANGE_CHANNEL; uni_notify.ChangeFeed listens. The DDL lives in uni_notify,
+# alembic revision 3c7d9e2a5b18 installs the same triggers.
+CHANGE_TABLES = (Subject, Group, Teacher, Student,
+                 TeacherSubject, StudentSubject, Grade)
+
+event.listen(Base.metadata, "before_create", DDL(NOTIFY_FUNCTION_SQL))
+for model in CHANGE_TABLES:
+    event.listen(model.__table__, "after_create",
+                 DDL(trigger_sql(model.__tablename__)))
@@ -2,35 +2,52 @@
 
 from __future__ import annotations
 
-import asyncio
-from aiologger import Logger
-from configparser import ConfigParser
 # from datetime import date
+import functools
 import os
 from pathlib import Path
 # import random
 
-from sqlalchemy import select
+from sqlalchemy import select, bindparam
 from sqlalchemy import and_
 from sqlalchemy.exc import IntegrityError, NoResultFound
-from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-
-uni_model = __import__("uni-model")
-Base = getattr(uni_model, "Base")
-Subject = getattr(uni_model, "Subject")
-Group = getattr(uni_model, "Group")
-Teacher = getattr(uni_model, "Teacher")
-Student = getattr(uni_model, "Student")
-TeacherSubject = getattr(uni_model, "TeacherSubject")
-StudentSubject = getattr(uni_model, "StudentSubject")
-Grade = getattr(uni_model, "Grade")
+from uni_engine import Router, create_engine, load_config, run
+from uni_output import diagnostics_logger, open_writer
+from uni_profile import profiler
+from uni_query import sql_text
+from uni_report import report_parser
 
 
 def excm(msg: str):
     return "{{{ " + "..... EXCEPTION ....." + os.linesep + msg + os.linesep + "}}}"
 
+@functools.cache
+def statement():
+    """The statement template, built once on first use: the model loads
+    only when the report runs
+    """
+    uni_model = __import__("uni-model")
+    Subject = uni_model.Subject
+    Teacher = uni_model.Teacher
+    Student = uni_model.Student
+    TeacherSubject = uni_model.TeacherSubject
+    StudentSubject = uni_model.StudentSubject
+
+    STMT = select(Student.fullname, Teacher.fullname, Subject.title) \
+            .select_from(StudentSubject) \
+            .join(TeacherSubject
+                  , onclause=TeacherSubject.teacher_id==bindparam("teacher_id")) \
+            .join(Student, onclause=Student.id==StudentSubject.student_id) \
+            .join(Teacher, onclause=Teacher.id==TeacherSubject.teacher_id) \
+            .join(Subject, onclause=Subject.id==StudentSubject.subject_id) \
+            .where(and_(  StudentSubject.subject_id == TeacherSubject.subject_id
+                        , StudentSubject.student_id == bindparam("student_id")
+                        , TeacherSubject.teacher_id == bindparam("teacher_id"))) \
+            .order_by(Student.fullname, Teacher.fullname)
+    return STMT
+
 ##################################################################################
 async def select_10(async_session: async_sessionmaker[AsyncSession]) -> None:
     """
@@ -52,27 +69,15 @@ async def select_10(async_session: async_sessionmaker[AsyncSession]) -> None:
             STUDENT_ID = 11
             TEACHER_ID = 4
 
-            stmt = select(Student.fullname, Teacher.fullname, Subject.title) \
-                    .select_from(StudentSubject) \
-                    .join(TeacherSubject
-                          , onclause=TeacherSubject.teacher_id==TEACHER_ID) \
-                    .join(Student, onclause=Student.id==StudentSubject.student_id) \
-                    .join(Teacher, onclause=Teacher.id==TeacherSubject.teacher_id) \
-                    .join(Subject, onclause=Subject.id==StudentSubject.subject_id) \
-                    .where(and_(  StudentSubject.subject_id == TeacherSubject.subject_id
-                                , StudentSubject.student_id == STUDENT_ID
-                                , TeacherSubject.teacher_id == TEACHER_ID)) \
-                    .order_by(Student.fullname, Teacher.fullname)
+            stmt = statement().params(student_id=STUDENT_ID, teacher_id=TEACHER_ID)
 
             await logger.info(f"{os.linesep}*** SQL: ***{os.linesep}"
-                              f"{str(stmt)}{os.linesep}")
-            result = await session.execute(stmt)
+                              f"{sql_text(statement())}{os.linesep}")
 
-            await logger.info(
+            out.line(
                 f"10. Список предметів, які певному студенту (id {STUDENT_ID}) "
                 f"читає певний викладач (id {TEACHER_ID}):")
-            for st, tr, sb in result:
-                await logger.info("%25s: %25s -> %-s" % (st, tr, sb))
+            await out.stream(session, stmt, "%25s: %25s -> %-s")
 
             await session.commit()
 
@@ -82,56 +87,24 @@ async def select_10(async_session: async_sessionmaker[AsyncSession]) -> None:
             await logger.error(excm(str(e)))
 
 async def async_main() -> None:
-    engine = create_async_engine(
-        f"postgresql+asyncpg://{CONF_PSUSER}:{CONF_PSPASS}"
-        f"@{CONF_PSHOST}:{CONF_PSPORT}/{CONF_PSNAME}",
-        echo=CONF_DGECHO,
-    )
+    engine = create_engine()
+    # reports read from the replica when one is configured and fresh enough
+    router = Router.from_config(engine, logger=logger)
     # async_sessionmaker: a factory for new AsyncSession objects.
     # expire_on_commit - don't expire objects after transaction commit
-    async_session = async_sessionmaker(engine, expire_on_commit=False)
+    async_session = async_sessionmaker(await router.reader(), expire_on_commit=False)
 
     await select_10(async_session)
 
     # for AsyncEngine created in function scope, close and
     # clean-up pooled connections
-    await engine.dispose()
-
-
-def overview_config():
-    global CONF_PSNAME, CONF_PSHOST, CONF_PSPORT, CONF_PSUSER, CONF_PSPASS
-    global CONF_DGECHO
-    try:
-        conf = ConfigParser()
-        confpathfile = Path(__file__)
-        confpathfile = confpathfile.parent / "config.ini"
-        conf.read(confpathfile)
-        conf_postgresql, conf_debug = "", ""
-        for s in conf.sections():
-            ss = s.strip().upper()
-            if "POSTGRESQL" == ss:
-                conf_postgresql = s
-            elif "DEBUG" == ss:
-                conf_debug = s
-        if not conf_postgresql or not conf_debug:
-            raise SyntaxError("Absent needed sections")
-        CONF_PSNAME, CONF_PSHOST, CONF_PSPORT, CONF_PSUSER, CONF_PSPASS = \
-            conf.get(conf_postgresql, "NAME"), \
-            conf.get(conf_postgresql, "HOST"), \
-            conf.get(conf_postgresql, "PORT"), \
-            conf.get(conf_postgresql, "USER"), \
-            conf.get(conf_postgresql, "PASS")
-        CONF_DGECHO = conf.get(conf_debug, "ECHO")
-        if CONF_DGECHO.isdigit() and int(CONF_DGECHO):
-            CONF_DGECHO = True
-        else:
-            CONF_DGECHO = False
-    except Exception as e:
-        print(f"Config file ('{confpathfile}'): {str(e)}")
-        exit(1)
+    await router.dispose()
+
 
 if __name__ == "__main__":
-    overview_config()
-    #print(CONF_PSNAME, CONF_PSHOST, CONF_PSPORT, CONF_PSUSER, CONF_PSPASS, CONF_DGECHO)
-    logger = Logger.with_default_handlers(name='NoPrintLogger')
-    asyncio.run(async_main())
+    args = report_parser(select_10.__doc__).parse_args()
+    load_config()
+    logger = diagnostics_logger(args.format, args.out)
+    out = open_writer(args.format, args.out, args.explain, Path(__file__).stem)
+    run(async_main(), profiler(args, Path(__file__).stem, logger))
+    out.close()
@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+from contextlib import redirect_stderr, redirect_stdout
+from contextvars import ContextVar
+import io
+import json
+import os
+from pathlib import Path
+import signal
+import sys
+
+# `seed.py --serve SOCKET` keeps one engine (a warm pool, the replica
+# checked once) and one name cache for all of its clients;
+# `seed.py --via SOCKET ...` is the thin client that forwards the rest of
+# its command line there.
+#
+# The protocol is JSON lines over a Unix socket. The client sends one
+# request, {"argv": [...]}, then reads frames until the server closes:
+#
+#   {"out": BASE64}                 result rows in the requested --format
+#   {"log": LEVEL, "msg": TEXT}     diagnostics
+#   {"status": N}                   last frame: the exit status
+#
+# Requests run concurrently, a task each. The modules serving them see
+# `logger` and `out` as ContextProxy objects, bound per request to its own
+# RequestLogger and ResultWriter.
+#
+# This module is imported by the client before SQLAlchemy is: keep it light.
+
+FRAME_SIZE = 48 << 10       # result bytes per {"out"} frame
+STREAM_LIMIT = 1 << 20      # longest frame line a reader accepts
+
+# options whose value is a path: the client makes it absolute, the daemon
+# runs in a directory of its own
+PATH_OPTIONS = ("--import-grades", "--explain", "--script", "--metrics")
+
+current_logger = ContextVar("current_logger")
+current_out = ContextVar("current_out")
+
+
+class RequestExit(Exception):
+    """Request ends before it runs: STATUS and TEXT go back to the client
+    """
+    def __init__(self, status: int, text: str):
+        super().__init__(text)
+        self.status = status
+        self.text = text
+
+
+class ContextProxy:
+    """Stands for the object that VAR holds in the current context
+    """
+    def __init__(self, var: ContextVar):
+        object.__setattr__(self, "_var", var)
+
+    def __getattr__(self, name):
+        return getattr(self._var.get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._var.get(), name, value)
+
+
+def send(writer, **frame) -> None:
+    writer.write(json.dumps(frame, ensure_ascii=False).encode() + b"\n")
+
+
+class FrameSink(io.RawIOBase):
+    """Byte stream to the client, as {"out": ...} frames. Writes do not
+    wait: the async writer of the rows awaits RequestLogger.drain() between
+    its partitions.
+    """
+    def __init__(self, writer):
+        super().__init__()
+        self.writer = writer
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        for i in range(0, len(data), FRAME_SIZE):
+            send(self.writer, out=base64.b64encode(
+                data[i:i + FRAME_SIZE]).decode("ascii"))
+        return len(data)
+
+
+def client_file(writer, binary: bool, buffer_size: int = 1 << 20):
+    """File object for a ResultWriter whose rows go to the client
+    """
+    raw = io.BufferedWriter(FrameSink(writer), buffer_size)
+    if binary:
+        return raw
+    return io.TextIOWrapper(raw, encoding="utf-8", newline="")
+
+
+class RequestLogger:
+    """The part of aiologger's Logger that seed.py and the reports use;
+    messages go to the client as {"log": ...} frames
+    """
+    def __init__(self, writer):
+        self.writer = writer
+        self.lock = asyncio.Lock()
+
+    async def log(self, level: str, msg) -> None:
+        send(self.writer, log=level, msg=str(msg))
+        await self.drain()
+
+    async def drain(self) -> None:
+        """Wait until the frames queued for the client are below the
+        transport's high-water mark: a slow client slows its request down
+        """
+        async with self.lock:
+            await self.writer.drain()
+
+    async def debug(self, msg) -> None:
+        await self.log("debug", msg)
+
+    async def info(self, msg) -> None:
+        await self.log("info", msg)
+
+    async def warning(self, msg) -> None:
+        await self.log("warning", msg)
+
+    async def error(self, msg) -> None:
+        await self.log("error", msg)
+
+    async def shutdown(self) -> None:
+        pass
+
+
+def resolve(obj):
+    """The object a ContextProxy stands for in the current context, or OBJ
+    """
+    if isinstance(obj, ContextProxy):
+        return obj._var.get()
+    return obj
+
+
+def bind(logger, out) -> None:
+    """LOGGER and OUT serve the current request
+    """
+    current_logger.set(logger)
+    current_out.set(out)
+
+
+def parse_args(parser: argparse.ArgumentParser, argv: list):
+    """PARSER.parse_args(ARGV); usage, --help and errors go to the client
+    instead of the daemon's terminal
+    """
+    text = io.StringIO()
+    try:
+        with redirect_stdout(text), redirect_stderr(text):
+            return parser.parse_args(argv)
+    except SystemExit as e:
+        raise RequestExit(e.code or 0, text.getvalue().rstrip())
+
+
+async def serve(path: str, handle, logger) -> None:
+    """Serve requests on the Unix socket PATH until SIGINT or SIGTERM.
+    await HANDLE(argv, writer) runs one request and returns its exit status.
+    """
+    async def client(reader, writer):
+        status = 1
+        try:
+            request = json.loads(await reader.readline())
+            status = await handle(list(request["argv"]), writer)
+        except RequestExit as e:
+            if e.text:
+                send(writer, log="error" if e.status else "info", msg=e.text)
+            status = e.status
+        except (ValueError, KeyError, TypeError) as e:
+            send(writer, log="error", msg=f"Bad request: {e!r}")
+        except Exception as e:
+            await logger.error(f"Request failed: {e!r}")
+            send(writer, log="error", msg=f"Request failed: {e!r}")
+        finally:
+            send(writer, status=status)
+            try:
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            except OSError:
+                pass                # the client went away
+
+    try:
+        _, probe = await asyncio.open_unix_connection(path)
+    except OSError:
+        pass                        # nobody serves there: take it over
+    else:
+        probe.close()
+        raise SystemExit(f"A daemon already serves on '{path}'")
+
+    server = await asyncio.start_unix_server(client, path, limit=STREAM_LIMIT)
+    os.chmod(path, 0o600)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await logger.info(f"Serving on '{path}', pid {os.getpid()}")
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        Path(path).unlink(missing_ok=True)
+        await logger.info("Stopped")
+
+
+async def forward(path: str, argv: list, out_path: str | None,
+                  log_file) -> int:
+    """Client side: run ARGV on the daemon at PATH, write its rows to
+    OUT_PATH (stdout if None) and its diagnostics to LOG_FILE
+    """
+    try:
+        reader, writer = await asyncio.open_unix_connection(
+            path, limit=STREAM_LIMIT)
+    except OSError as e:
+        print(f"No daemon on '{path}' (start one with seed.py --serve): {e}",
+              file=sys.stderr)
+        return 1
+    send(writer, argv=argv)
+    await writer.drain()
+
+    if out_path is None or out_path == "-":
+        out = open(sys.stdout.fileno(), "wb", closefd=False)
+    else:
+        out = open(out_path, "wb")
+    status = 1
+    try:
+        while line := await reader.readline():
+            frame = json.loads(line)
+            if "out" in frame:
+                out.write(base64.b64decode(frame["out"]))
+            elif "log" in frame:
+                out.flush()
+                print(frame["msg"], file=log_file, flush=True)
+            elif "status" in frame:
+                status = frame["status"]
+    except BrokenPipeError:
+        pass                        # | head has all it wants
+    finally:
+        out.close()
+        writer.close()
+    return status
+
+
+def absolute(path: str) -> str:
+    """PATH made absolute for the daemon; '-' (stdin / stdout) stays as is
+    """
+    return path if path == "-" else os.path.abspath(path)
+
+
+def client_main(argv: list) -> int:
+    """seed.py --via SOCKET [options]: the options are run by the daemon,
+    --out stays on this side
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--via", metavar="SOCKET", required=True)
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--format", default="text")
+    args, rest = parser.parse_known_args(argv)
+    for n, arg in enumerate(rest):
+        option, eq, value = arg.partition("=")
+        if option not in PATH_OPTIONS:
+            continue
+        if eq:
+            rest[n] = f"{option}={absolute(value)}"
+        elif n + 1 < len(rest):
+            rest[n + 1] = absolute(rest[n + 1])
+    # diagnostics_logger() rule: next to text rows, else on stderr
+    to_stdout = args.format == "text" or args.out not in (None, "-")
+    return asyncio.run(forward(args.via, rest + ["--format", args.format],
+                               args.out, sys.stdout if to_stdout else sys.stderr))
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import asyncio
+from configparser import ConfigParser
+import functools
+from pathlib import Path
+import platform
+import sys
+import time
+
+from sqlalchemy import text
+from sqlalchemy.engine import URL
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import uni_metrics
+
+# The one place where engines are made. Every entry point takes its
+# connection and pool settings from config.ini:
+#
+#   [ POSTGRESQL ]
+#   NAME, HOST, PORT, USER, PASS    HOST may be a Unix-socket directory
+#   POOL_SIZE, MAX_OVERFLOW         pool size and connections above it
+#   POOL_PRE_PING = 0|1             test a connection on every checkout
+#   POOL_RECYCLE                    seconds until a connection is replaced
+#   STATEMENT_CACHE_SIZE            prepared statements kept per connection
+#                                   (SQLAlchemy's asyncpg adapter cache and
+#                                   asyncpg's own); 0 for pgbouncer
+#   CONNECT_TIMEOUT                 seconds to establish a connection
+#   COMMAND_TIMEOUT                 seconds a statement may run
+#
+#   [ DEBUG ]
+#   ECHO = 0|1                      log every statement
+#   SLOW_QUERY_MS, METRICS          statement timings, see uni_metrics.py
+#
+#   [ ASYNCIO ]
+#   UVLOOP = 0|1                    run the event loop on uvloop
+#
+# Keys that are absent keep the SQLAlchemy / asyncpg defaults.
+#
+# Optional read replica: reports and seed.py --r? reads go to the
+# [ POSTGRESQL_REPLICA ] server, writes stay on [ POSTGRESQL ]. A replica
+# whose replay LSN lags the primary by more than MAX_LAG bytes of WAL (or
+# that cannot be reached) is skipped and the read runs on the primary.
+# Every key missing in that section is taken from [ POSTGRESQL ].
+#
+#   [ POSTGRESQL_REPLICA ]
+#   HOST = 127.0.0.1
+#   PORT = 5433
+#   MAX_LAG = 16777216
+
+CONFIG = Path(__file__).parent / "config.ini"
+
+MAX_LAG = 16 << 20
+REPLICA_TIMEOUT = 2.0   # seconds to wait for the replica before giving up
+REPLICA_CHECK_TTL = 5.0  # seconds a replica check holds for a long-lived Router
+
+
+def flag(value: str) -> bool:
+    return value.isdigit() and bool(int(value))
+
+
+# config.ini key: (argument, type)
+POOL_OPTIONS = {
+    "POOL_SIZE": ("pool_size", int),
+    "MAX_OVERFLOW": ("max_overflow", int),
+    "POOL_PRE_PING": ("pool_pre_ping", flag),
+    "POOL_RECYCLE": ("pool_recycle", int),
+}
+CONNECT_OPTIONS = {
+    "STATEMENT_CACHE_SIZE": ("prepared_statement_cache_size", int),
+    "CONNECT_TIMEOUT": ("timeout", float),
+    "COMMAND_TIMEOUT": ("command_timeout", float),
+}
+
+
+def config_section(conf: ConfigParser, name: str) -> str | None:
+    """Section name as written in config.ini ('[ POSTGRESQL ]' -> ' POSTGRESQL ')
+    """
+    for s in conf.sections():
+        if s.strip().upper() == name:
+            return s
+    return None
+
+
+def engine_settings(conf: ConfigParser, section: str,
+                    fallback: str | None = None) -> tuple[URL, dict]:
+    """(URL, create_async_engine() keyword arguments) of SECTION
+    """
+    def get(key: str) -> str | None:
+        for s in (section, fallback):
+            if s is not None and conf.has_option(s, key):
+                return conf.get(s, key)
+        return None
+
+    for key in ("NAME", "HOST", "USER", "PASS"):
+        if get(key) is None:
+            raise SyntaxError(f"Absent '{key}' in [{section.strip()}]")
+    host, port = get("HOST"), get("PORT")
+    kwargs = { arg: conv(get(key)) for key, (arg, conv) in POOL_OPTIONS.items()
+               if get(key) is not None }
+    connect_args = { arg: conv(get(key))
+                     for key, (arg, conv) in CONNECT_OPTIONS.items()
+                     if get(key) is not None }
+    if "prepared_statement_cache_size" in connect_args:
+        # the adapter prepares every statement itself; asyncpg's cache is
+        # left for the driver-level calls (COPY, LISTEN)
+        connect_args["statement_cache_size"] = \
+            connect_args["prepared_statement_cache_size"]
+    if host.startswith("/"):
+        # Unix socket: asyncpg takes the directory as host, the URL has none
+        connect_args["host"] = host
+        connect_args["port"] = int(port or 5432)
+        host, port = None, None
+    url = URL.create("postgresql+asyncpg", username=get("USER"),
+                     password=get("PASS"), host=host,
+                     port=int(port) if port else None, database=get("NAME"))
+    if connect_args:
+        kwargs["connect_args"] = connect_args
+    return url, kwargs
+
+
+@functools.cache
+def load_config(path: Path = CONFIG) -> dict:
+    """Engine settings of config.ini; exits with a message when it is unusable
+    """
+    try:
+        conf = ConfigParser()
+        if not conf.read(path):
+            raise FileNotFoundError("cannot read it")
+        primary = config_section(conf, "POSTGRESQL")
+        debug = config_section(conf, "DEBUG")
+        if not primary or not debug:
+            raise SyntaxError("Absent needed sections")
+        settings = {
+            "echo": flag(conf.get(debug, "ECHO")),
+            "slow_ms": conf.getfloat(debug, "SLOW_QUERY_MS", fallback=0),
+            "metrics": conf.get(debug, "METRICS", fallback=None),
+            "primary": engine_settings(conf, primary),
+            "replica": None,
+            "max_lag": MAX_LAG,
+            "uvloop": False,
+        }
+        replica = config_section(conf, "POSTGRESQL_REPLICA")
+        if replica is not None:
+            settings["replica"] = engine_settings(conf, replica, primary)
+            settings["max_lag"] = conf.getint(replica, "MAX_LAG", fallback=MAX_LAG)
+        aio = config_section(conf, "ASYNCIO")
+        if aio is not None:
+            settings["uvloop"] = flag(conf.get(aio, "UVLOOP", fallback="0"))
+    except Exception as e:
+        print(f"Config file ('{path}'): {str(e)}")
+        exit(1)
+    return settings
+
+
+def create_engine(role: str = "primary", path: Path = CONFIG, **kwargs):
+    """AsyncEngine of the [ POSTGRESQL ] ('primary') or [ POSTGRESQL_REPLICA ]
+    ('replica') server; KWARGS override config.ini
+    """
+    settings = load_config(path)
+    url, engine_kwargs = settings[role]
+    engine = create_async_engine(url, **{"echo": settings["echo"],
+                                         "poolclass": uni_metrics.TimedPool,
+                                         **engine_kwargs, **kwargs})
+    if settings["slow_ms"] or settings["metrics"]:
+        uni_metrics.metrics(settings["slow_ms"]).attach(engine)
+    return engine
+
+
+def run(main, profile=None):
+    """asyncio.run(MAIN) on the event loop config.ini asks for, under the
+    uni_profile.Profiler PROFILE if given; then the statement metrics go
+    where [ DEBUG ] METRICS says
+    """
+    try:
+        if profile is None:
+            return run_loop(main)
+        with profile:
+            return run_loop(profile.main(main))
+    finally:
+        path = load_config()["metrics"]
+        if path and uni_metrics.METRICS is not None:
+            print(uni_metrics.METRICS.summary(), file=sys.stderr)
+            uni_metrics.METRICS.write(path)
+
+
+def run_loop(main):
+    if load_config()["uvloop"]:
+        try:
+            import uvloop
+        except ImportError:
+            print("UVLOOP = 1 needs uvloop: pip install uvloop; using asyncio")
+        else:
+            return uvloop.run(main)
+    if platform.system() == 'Windows':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    return asyncio.run(main)
+
+
+def lsn(value: str) -> int:
+    """'16/B374D848' -> byte position in the WAL
+    """
+    hi, lo = value.split("/")
+    return (int(hi, 16) << 32) + int(lo, 16)
+
+
+class Router:
+    """Primary engine for writes, replica engine (if any) for reads
+    """
+    def __init__(self, primary, replica=None, max_lag: int = MAX_LAG,
+                 logger=None):
+        self.primary = primary
+        self.replica = replica
+        self.max_lag = max_lag
+        self.logger = logger
+        self.reader_engine = None
+        self.checked_until = 0.0
+        self.checking = asyncio.Lock()
+
+    @classmethod
+    def from_config(cls, primary, logger=None, path: Path = CONFIG) -> "Router":
+        settings = load_config(path)
+        if settings["replica"] is None:
+            return cls(primary, logger=logger)
+        return cls(primary, create_engine("replica", path),
+                   settings["max_lag"], logger)
+
+    async def replay_lag(self) -> int:
+        """Bytes of primary WAL the replica has not replayed yet
+        """
+        async with self.replica.connect() as conn:
+            recovery, replayed = (await conn.execute(text(
+                "SELECT pg_is_in_recovery(), pg_last_wal_replay_lsn()::text"))).one()
+        if not recovery:
+            return 0            # promoted: it is a primary itself
+        async with self.primary.connect() as conn:
+            current = (await conn.execute(text(
+                "SELECT pg_current_wal_lsn()::text"))).scalar_one()
+        return max(lsn(current) - lsn(replayed or "0/0"), 0)
+
+    async def reader(self):
+        """Engine for reads: the replica unless it is too stale or down.
+        The check holds for REPLICA_CHECK_TTL seconds, so a daemon's Router
+        notices a replica that falls behind, dies or comes back.
+        """
+        if self.replica is None:
+            return self.primary
+        async with self.checking:
+            if time.monotonic() >= self.checked_until:
+                self.reader_engine = await self.check_replica()
+                self.checked_until = time.monotonic() + REPLICA_CHECK_TTL
+        return self.reader_engine
+
+    async def check_replica(self):
+        try:
+            lag = await asyncio.wait_for(self.replay_lag(), REPLICA_TIMEOUT)
+        except (OSError, DBAPIError, asyncio.TimeoutError) as e:
+            await self.warn(f"Replica unavailable, reading from primary: {e!r}")
+            return self.primary
+        if lag > self.max_lag:
+            await self.warn(f"Replica lags {lag} bytes of WAL "
+                            f"(> {self.max_lag}), reading from primary")
+            return self.primary
+        return self.replica
+
+    def failed(self, engine, error: Exception) -> None:
+        """ERROR ended a read on ENGINE: when the replica's connection was
+        lost, the next reader() checks it again instead of trusting the
+        last check
+        """
+        lost = isinstance(error, OSError) \
+            or getattr(error, "connection_invalidated", False)
+        if engine is self.replica and engine is not None and lost:
+            self.checked_until = 0.0
+
+    async def warn(self, msg: str) -> None:
+        if self.logger is not None:
+            await self.logger.warning(msg)
+
+    async def dispose(self) -> None:
+        if self.replica is not None:
+            await self.replica.dispose()
+        await self.primary.dispose()
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+
+from uni_output import ResultWriter, literal_sql
+
+# --explain DIR: read paths do not print rows, they run
+#     EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) <query>
+# and store {"sql": ..., "plan": ...} as DIR/<label>.json. explain-check.py
+# then compares such a directory with a baseline one.
+
+EXPLAIN = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+
+ROWS_FACTOR = 10.0      # estimate vs actual rows, either direction
+COST_FACTOR = 1.5       # total cost against baseline
+WATCHED_TABLES = ("grades",)
+
+
+class ExplainWriter(ResultWriter):
+    """Stores query plans instead of result rows; prints one summary line
+    per plan.
+    """
+    format = "explain"
+
+    def __init__(self, plan_dir: str, label: str = "plan", **kwargs):
+        super().__init__(**kwargs)
+        self.plan_dir = Path(plan_dir)
+        self.plan_dir.mkdir(parents=True, exist_ok=True)
+        self.label = label
+        self.used = set()
+
+    def line(self, text: str) -> None:
+        pass
+
+    def plan_path(self) -> Path:
+        name, n = self.label, 1
+        while name in self.used:
+            n += 1
+            name = f"{self.label}-{n}"
+        self.used.add(name)
+        return self.plan_dir / f"{name}.json"
+
+    async def stream(self, session, stmt, fmt: str,
+                     columns: list | None = None, transform=None) -> int:
+        conn = await session.connection()
+        sql = literal_sql(stmt, conn.dialect)
+        result = await conn.exec_driver_sql(EXPLAIN + sql)
+        plan = result.scalar_one()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        path = self.plan_path()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"sql": sql, "plan": plan}, f, ensure_ascii=False, indent=2)
+
+        top = plan[0]
+        self.file.write("%-24s cost %10.2f  rows %8d  %9.3f ms  %s" % (
+            path.stem, top["Plan"]["Total Cost"], top["Plan"]["Actual Rows"],
+            top["Execution Time"], path) + os.linesep)
+        return 0
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def load_plan(path: Path) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["plan"][0]
+
+
+def seq_scans(plan: dict) -> set:
+    return { n["Relation Name"] for n in plan_nodes(plan["Plan"])
+             if n["Node Type"] == "Seq Scan"
+                and n.get("Relation Name") in WATCHED_TABLES }
+
+
+def estimate_errors(plan: dict, rows_factor: float) -> list:
+    """Nodes whose row estimate is off by more than ROWS_FACTOR
+    """
+    errors = []
+    for n in plan_nodes(plan["Plan"]):
+        if not n.get("Actual Loops"):
+            continue            # never executed
+        planned, actual = n["Plan Rows"], n["Actual Rows"]
+        ratio = max(planned, 1) / max(actual, 1)
+        if ratio > rows_factor or 1 / ratio > rows_factor:
+            errors.append((n["Node Type"], n.get("Relation Name", ""),
+                           planned, actual))
+    return errors
+
+
+def compare_plans(baseline: dict, current: dict,
+                  rows_factor: float = ROWS_FACTOR,
+                  cost_factor: float = COST_FACTOR) -> list:
+    """Return the list of human-readable issues of CURRENT against BASELINE
+    """
+    issues = []
+    new_scans = seq_scans(current) - seq_scans(baseline)
+    for table in sorted(new_scans):
+        issues.append(f"new Seq Scan on '{table}'")
+
+    base_cost = baseline["Plan"]["Total Cost"]
+    cost = current["Plan"]["Total Cost"]
+    if base_cost > 0 and cost > base_cost * cost_factor:
+        issues.append(f"cost {base_cost:.2f} -> {cost:.2f} "
+                      f"(x{cost / base_cost:.1f})")
+
+    for node, table, planned, actual in estimate_errors(current, rows_factor):
+        where = f"{node} on '{table}'" if table else node
+        issues.append(f"{where}: estimated {planned} rows, actual {actual}")
+    return issues
+
+
+def compare_dirs(baseline_dir: str, current_dir: str,
+                 rows_factor: float = ROWS_FACTOR,
+                 cost_factor: float = COST_FACTOR) -> dict:
+    """Map plan name -> issues for every plan found in both directories;
+    plans missing on either side are reported as issues too.
+    """
+    base = { p.stem: p for p in Path(baseline_dir).glob("*.json") }
+    curr = { p.stem: p for p in Path(current_dir).glob("*.json") }
+    report = {}
+    for name in sorted(base.keys() | curr.keys()):
+        if name not in curr:
+            report[name] = ["missing in current run"]
+        elif name not in base:
+            report[name] = ["no baseline"]
+        else:
+            report[name] = compare_plans(load_plan(base[name]),
+                                         load_plan(curr[name]),
+                                         rows_factor, cost_factor)
+    return report
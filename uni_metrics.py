@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+import hashlib
+import json
+from pathlib import Path
+import re
+import sys
+import time
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Statement timings of an engine, from its cursor events:
+#
+#   per statement fingerprint   latency histogram, calls, rows
+#   pool                        checkout wait histogram (opening a new
+#                               connection included; TimedPool), connections
+#                               opened
+#   slow-query log              statements slower than SLOW_QUERY_MS go to
+#                               stderr as they finish
+#
+# config.ini [ DEBUG ] turns it on for every engine create_engine() makes:
+#
+#   SLOW_QUERY_MS = 500         log statements slower than this (0: off)
+#   METRICS = metrics.json      at exit print a summary table to stderr and
+#                               write the metrics there: JSON for *.json,
+#                               Prometheus text otherwise
+#
+# seed.py --metrics FILE writes them on demand, from a --serve daemon too.
+# The COPY of --format csv runs on the driver connection, outside the cursor
+# events: it is not timed.
+# A fingerprint is the statement with its whitespace collapsed and its
+# literals and $N parameters replaced by '?'; the statement templates of
+# this repo bind their values, so one template is one fingerprint. The
+# normalized text of pg_stat_statements maps to the same fingerprint (see
+# pgstat-diff.py).
+
+BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+SUMMARY_TOP = 15        # statements in the summary table
+SQL_WIDTH = 70          # statement text in the summary table
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\$\d+|(?<![\w.])\d+(?:\.\d+)?\b")
+
+
+class Histogram:
+    """Counts of observations (milliseconds) per BUCKETS_MS bucket
+    """
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)   # the last one: +Inf
+        self.count = 0
+        self.total = self.max = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the Q quantile
+        """
+        rank, seen = q * self.count, 0
+        for bound, n in zip(BUCKETS_MS, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def cumulative(self) -> list:
+        """[(le, count of observations <= le)], Prometheus style
+        """
+        result, seen = [], 0
+        for bound, n in zip(BUCKETS_MS + ("+Inf",), self.counts):
+            seen += n
+            result.append((bound, seen))
+        return result
+
+    def as_dict(self) -> dict:
+        return {"count": self.count, "total_ms": round(self.total, 3),
+                "max_ms": round(self.max, 3),
+                "buckets": { str(le): n for le, n in self.cumulative() }}
+
+
+class TimedPool(AsyncAdaptedQueuePool):
+    """The pool of the engines uni_engine.create_engine() makes: it times
+    every checkout, opening a new connection included, into METRICS once
+    that exists. There is no pool event before a checkout.
+    """
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            if METRICS is not None:
+                METRICS.checkout.observe((time.perf_counter() - start) * 1000)
+
+
+class StatementStats:
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.latency = Histogram()
+        self.rows = 0
+
+
+_fingerprints = {}
+
+
+def fingerprint(statement: str) -> tuple[str, str]:
+    """(id, normalized SQL) of STATEMENT; the id is 8 hex digits
+    """
+    try:
+        return _fingerprints[statement]
+    except KeyError:
+        sql = LITERALS.sub("?", " ".join(statement.split()))
+        result = (hashlib.blake2b(sql.encode(), digest_size=4).hexdigest(), sql)
+        if len(_fingerprints) >= 10000:
+            _fingerprints.clear()   # literal SQL: do not grow without bound
+        _fingerprints[statement] = result
+        return result
+
+
+class Metrics:
+    """Statement and pool timings of the engines it is attached to
+    """
+    def __init__(self, slow_ms: float = 0):
+        self.slow_ms = slow_ms
+        self.statements = {}
+        self.checkout = Histogram()
+        self.opened = 0
+        self.slow = 0
+        self.engines = []
+
+    def attach(self, engine) -> None:
+        sync_engine = engine.sync_engine
+        if sync_engine in self.engines:
+            return
+        self.engines.append(sync_engine)
+        event.listen(sync_engine, "before_cursor_execute",
+                     self.before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute",
+                     self.after_cursor_execute)
+        event.listen(sync_engine, "handle_error", self.handle_error)
+        # the checkouts are timed by the engine's TimedPool; the pool's
+        # "connect" event counts the new connections among them
+        event.listen(sync_engine, "connect", self.pool_connect)
+
+    def pool_connect(self, dbapi_connection, connection_record):
+        self.opened += 1
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters,
+                             context, executemany):
+        ms = (time.perf_counter() - conn.info["metrics_start"].pop()) * 1000
+        key, sql = fingerprint(statement)
+        stats = self.statements.get(key)
+        if stats is None:
+            stats = self.statements[key] = StatementStats(sql)
+        stats.latency.observe(ms)
+        if cursor.rowcount < 0 and cursor.description is not None:
+            # a server-side cursor: its rows are fetched later, and
+            # ResultWriter.stream() counts them
+            conn.info["metrics_streamed"] = stats
+        elif cursor.rowcount > 0:
+            stats.rows += cursor.rowcount
+        if self.slow_ms and ms >= self.slow_ms:
+            self.slow += 1
+            print(f"Slow query {ms:.1f} ms [{key}]: {sql}", file=sys.stderr,
+                  flush=True)
+
+    def streamed(self, info: dict, count: int) -> None:
+        """COUNT rows were fetched from the last server-side cursor of the
+        connection with INFO
+        """
+        stats = info.pop("metrics_streamed", None)
+        if stats is not None:
+            stats.rows += count
+
+    def handle_error(self, context):
+        starts = context.connection.info.get("metrics_start") \
+            if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+    def summary(self, top: int = SUMMARY_TOP) -> str:
+        lines = ["%8s %10s %8s %8s %8s %8s  %-8s  %s" % (
+            "calls", "total ms", "mean", "p95", "max", "rows", "id", "sql")]
+        ranked = sorted(self.statements.items(),
+                        key=lambda item: item[1].latency.total, reverse=True)
+        for key, stats in ranked[:top]:
+            h = stats.latency
+            lines.append("%8d %10.1f %8.2f %8.1f %8.1f %8d  %-8s  %s" % (
+                h.count, h.total, h.total / h.count, h.quantile(0.95), h.max,
+                stats.rows, key, stats.sql[:SQL_WIDTH]))
+        if len(ranked) > top:
+            lines.append(f"... {len(ranked) - top} more statement(s)")
+        c = self.checkout
+        lines.append(f"Pool checkouts {c.count} ({self.opened} new "
+                     f"connection(s)), waited {c.total:.1f} ms, "
+                     f"p95 {c.quantile(0.95):.1f} ms, max {c.max:.1f} ms; "
+                     f"{self.slow} slow statement(s)")
+        return "\n".join(lines)
+
+    def as_dict(self) -> dict:
+        return {
+            "statements": [ {"id": key, "sql": stats.sql, "rows": stats.rows,
+                             **stats.latency.as_dict()}
+                            for key, stats in self.statements.items() ],
+            "pool_checkout": self.checkout.as_dict(),
+            "pool_connections_opened": self.opened,
+            "slow_statements": self.slow,
+            "slow_query_ms": self.slow_ms,
+        }
+
+    def prometheus(self) -> str:
+        lines = []
+
+        def histogram(name: str, help: str, series: list) -> None:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, h in series:
+                sep = "," if labels else ""
+                for le, n in h.cumulative():
+                    le = le if le == "+Inf" else le / 1000
+                    lines.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {n}')
+                labels = f"{{{labels}}}" if labels else ""
+                lines.append(f"{name}_sum{labels} {h.total / 1000}")
+                lines.append(f"{name}_count{labels} {h.count}")
+
+        histogram("uni_statement_duration_seconds",
+                  "Statement execution time per fingerprint",
+                  [ (f'query="{key}"', stats.latency)
+                    for key, stats in self.statements.items() ])
+        lines.append("# HELP uni_statement_rows_total Rows returned or "
+                     "affected per fingerprint")
+        lines.append("# TYPE uni_statement_rows_total counter")
+        for key, stats in self.statements.items():
+            lines.append(f'uni_statement_rows_total{{query="{key}"}} '
+                         f'{stats.rows}')
+        lines.append("# HELP uni_statement_info Statement text of a "
+                     "fingerprint")
+        lines.append("# TYPE uni_statement_info gauge")
+        for key, stats in self.statements.items():
+            sql = stats.sql.replace("\\", "\\\\").replace('"', '\\"')
+            lines.append(f'uni_statement_info{{query="{key}",sql="{sql}"}} 1')
+        histogram("uni_pool_checkout_seconds",
+                  "Time to check a connection out of the pool",
+                  [ ("", self.checkout) ])
+        lines.append("# HELP uni_pool_connections_opened_total New "
+                     "connections the pool opened")
+        lines.append("# TYPE uni_pool_connections_opened_total counter")
+        lines.append(f"uni_pool_connections_opened_total {self.opened}")
+        lines.append("# HELP uni_slow_statements_total Statements over "
+                     "SLOW_QUERY_MS")
+        lines.append("# TYPE uni_slow_statements_total counter")
+        lines.append(f"uni_slow_statements_total {self.slow}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """Dump to PATH: JSON for *.json, Prometheus text otherwise
+        """
+        if Path(path).suffix == ".json":
+            text = json.dumps(self.as_dict(), ensure_ascii=False, indent=1)
+        else:
+            text = self.prometheus()
+        Path(path).write_text(text, encoding="utf-8")
+
+
+METRICS: Metrics | None = None
+
+
+def metrics(slow_ms: float = 0) -> Metrics:
+    """The process's Metrics, made on first use
+    """
+    global METRICS
+    if METRICS is None:
+        METRICS = Metrics(slow_ms)
+    return METRICS
@@ -2,22 +2,18 @@
 
 from __future__ import annotations
 
-import asyncio
 from aiologger import Logger
-from configparser import ConfigParser
 from datetime import date
 from faker import Faker
 import os
-from pathlib import Path
-import platform
 import random
 
 from sqlalchemy.exc import IntegrityError, ObjectNotExecutableError
 from sqlalchemy.exc import ProgrammingError, DBAPIError
-from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 
+from uni_engine import create_engine, load_config, run
 from uni_model0 import Base, Subject, Teacher, Student, TeacherSubject, \
                         StudentSubject, Grade
 
@@ -134,11 +130,7 @@ async def insert_fake_objects(async_session: async_sessionmaker[AsyncSession]) -
             await logger.error(excm(str(e)))
 
 async def async_init() -> None:
-    engine = create_async_engine(
-        f"postgresql+asyncpg://{CONF_PSUSER}:{CONF_PSPASS}"
-        f"@{CONF_PSHOST}:{CONF_PSPORT}/{CONF_PSNAME}",
-        echo=CONF_DGECHO,
-    )
+    engine = create_engine()
     # async_sessionmaker: a factory for new AsyncSession objects.
     # expire_on_commit - don't expire objects after transaction commit
     async_session = async_sessionmaker(engine, expire_on_commit=False)
@@ -165,41 +157,7 @@ async def async_init() -> None:
     await engine.dispose()
 
 
-def overview_config():
-    global CONF_PSNAME, CONF_PSHOST, CONF_PSPORT, CONF_PSUSER, CONF_PSPASS
-    global CONF_DGECHO
-    try:
-        conf = ConfigParser()
-        confpathfile = Path(__file__)
-        confpathfile = confpathfile.parent / "config.ini"
-        conf.read(confpathfile)
-        conf_postgresql, conf_debug = "", ""
-        for s in conf.sections():
-            ss = s.strip().upper()
-            if "POSTGRESQL" == ss:
-                conf_postgresql = s
-            elif "DEBUG" == ss:
-                conf_debug = s
-        if not conf_postgresql or not conf_debug:
-            raise SyntaxError("Absent needed sections")
-        CONF_PSNAME, CONF_PSHOST, CONF_PSPORT, CONF_PSUSER, CONF_PSPASS = \
-            conf.get(conf_postgresql, "NAME"), \
-            conf.get(conf_postgresql, "HOST"), \
-            conf.get(conf_postgresql, "PORT"), \
-            conf.get(conf_postgresql, "USER"), \
-            conf.get(conf_postgresql, "PASS")
-        CONF_DGECHO = conf.get(conf_debug, "ECHO")
-        if CONF_DGECHO.isdigit() and int(CONF_DGECHO):
-            CONF_DGECHO = True
-        else:
-            CONF_DGECHO = False
-    except Exception as e:
-        print(f"Config file ('{confpathfile}'): {str(e)}")
-        exit(1)
-
 if __name__ == "__main__":
-    if platform.system() == 'Windows':
-        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-    overview_config()
+    load_config()
     logger = Logger.with_default_handlers(name='NoPrintLogger')
-    asyncio.run(async_init())
+    run(async_init())
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+import json
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+# Change feed. The statement triggers of the model NOTIFY on CHANGE_CHANNEL
+# every statement that changed a table, as '["grades", "INSERT"]'; within
+# one transaction PostgreSQL sends a payload once. uni-model.py,
+# uni_model_alembic.py and the alembic revision that adds the triggers take
+# their DDL from here. A ChangeFeed LISTENs on one connection, collects the
+# changes of a burst and hands them to its subscribers at once, as
+# {table: {operation, ...}}:
+#
+#   feed = ChangeFeed(engine, CHANGE_CHANNEL, logger)
+#   feed.subscribe(lambda changes: TABLE_VERSIONS.bump(changes))
+#   feed.start()
+#   ...
+#   await feed.close()
+#
+# A burst ends after DEBOUNCE seconds without a change, or MAX_DELAY seconds
+# after its first change while changes keep coming. A subscriber may be a
+# function or a coroutine function. When the connection is lost, the feed
+# reconnects and reports every table as changed: what happened in between
+# was not heard.
+
+DEBOUNCE = 0.2          # seconds of quiet that end a burst
+MAX_DELAY = 2.0         # longest a change waits during a steady stream
+RECONNECT_DELAY = 5.0   # seconds between connection attempts
+
+CHANGE_CHANNEL = "uni_changes"
+NOTIFY_FUNCTION = "uni_notify_change"
+
+NOTIFY_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION {NOTIFY_FUNCTION}() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('{CHANGE_CHANNEL}',
+                      CAST(json_build_array(TG_TABLE_NAME, TG_OP) AS text));
+    RETURN NULL;
+END
+$$"""
+DROP_NOTIFY_FUNCTION_SQL = f"DROP FUNCTION {NOTIFY_FUNCTION}()"
+
+
+def trigger_sql(table: str) -> str:
+    """CREATE TRIGGER of the change feed on TABLE
+    """
+    return (f"CREATE TRIGGER {table}_notify "
+            f"AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table} "
+            f"FOR EACH STATEMENT EXECUTE FUNCTION {NOTIFY_FUNCTION}()")
+
+
+def drop_trigger_sql(table: str) -> str:
+    return f"DROP TRIGGER {table}_notify ON {table}"
+
+
+class ChangeFeed:
+    """LISTEN on CHANNEL over a connection of ENGINE; fan coalesced bursts
+    of changes out to the subscribers
+    """
+    def __init__(self, engine, channel: str, logger=None,
+                 debounce: float = DEBOUNCE, max_delay: float = MAX_DELAY):
+        self.engine = engine
+        self.channel = channel
+        self.logger = logger
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.subscribers = []
+        self.pending = {}
+        self.tables = set()
+        self.last = 0.0
+        self.flusher = None
+        self.task = None
+        self.changes = self.bursts = 0
+
+    def subscribe(self, callback) -> None:
+        """CALLBACK(changes) after every burst
+        """
+        self.subscribers.append(callback)
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def close(self) -> None:
+        for task in (self.task, self.flusher):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+    async def run(self) -> None:
+        """Listen until cancelled, reconnecting when the connection is lost
+        """
+        heard_before = False
+        while True:
+            try:
+                async with self.engine.connect() as conn:
+                    await self.check(conn)
+                    raw = (await conn.get_raw_connection()).driver_connection
+                    lost = asyncio.Event()
+                    raw.add_termination_listener(lambda _: lost.set())
+                    await raw.add_listener(self.channel, self.notified)
+                    await self.log("info", f"Listening on '{self.channel}'")
+                    if heard_before:
+                        self.missed()
+                    heard_before = True
+                    try:
+                        await lost.wait()
+                    finally:
+                        if not raw.is_closed():
+                            await raw.remove_listener(self.channel,
+                                                      self.notified)
+                    # not back into the pool
+                    await conn.invalidate()
+                await self.log("warning", "Change feed connection lost")
+            except (OSError, DBAPIError) as e:
+                await self.log("warning", f"Change feed: {e!r}")
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def check(self, conn) -> None:
+        """Learn the tables with change triggers; warn when there are none
+        """
+        self.tables = set((await conn.execute(text(
+            "SELECT DISTINCT c.relname FROM pg_trigger t"
+            " JOIN pg_class c ON c.oid = t.tgrelid"
+            " JOIN pg_proc p ON p.oid = t.tgfoid"
+            " WHERE p.proname = :function"),
+            {"function": NOTIFY_FUNCTION})).scalars())
+        await conn.rollback()
+        if not self.tables:
+            await self.log("warning", "No change triggers in the database "
+                                      "(alembic upgrade head): the feed "
+                                      "stays silent")
+
+    def notified(self, connection, pid, channel, payload) -> None:
+        try:
+            table, op = json.loads(payload)[:2]
+        except (ValueError, TypeError):
+            return
+        self.add(table, {op})
+
+    def missed(self) -> None:
+        """Changes may have been lost: report every table
+        """
+        for table in self.tables:
+            self.add(table, {"*"})
+
+    def add(self, table: str, changes: set) -> None:
+        self.pending.setdefault(table, set()).update(changes)
+        self.changes += len(changes)
+        self.last = asyncio.get_running_loop().time()
+        if self.flusher is None:
+            self.flusher = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_delay
+        while (wait := min(self.last + self.debounce, deadline)
+                       - loop.time()) > 0:
+            await asyncio.sleep(wait)
+        changes, self.pending = self.pending, {}
+        self.flusher = None
+        self.bursts += 1
+        await self.publish(changes)
+
+    async def publish(self, changes: dict) -> None:
+        for callback in self.subscribers:
+            try:
+                result = callback(changes)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                await self.log("error", f"Change subscriber {callback!r} "
+                                        f"failed: {e!r}")
+
+    async def log(self, level: str, msg: str) -> None:
+        if self.logger is not None:
+            await getattr(self.logger, level)(msg)
+
+    def summary(self) -> str:
+        return (f"Change feed heard {self.changes} change(s) "
+                f"in {self.bursts} burst(s)")
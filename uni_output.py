@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+from aiologger import Logger
+from aiologger.handlers.streams import AsyncStreamHandler
+from aiologger.levels import LogLevel
+import csv
+import io
+import json
+import os
+import sys
+from itertools import islice
+
+import uni_metrics
+
+# Result rows do not go through aiologger: every `await logger.info()` costs
+# a coroutine round trip, a handler dispatch and a write per row. Rows are
+# formatted a batch at a time and written through one large buffer instead,
+# while the logger keeps carrying diagnostics only.
+
+BATCH_SIZE = 1000
+BUFFER_SIZE = 1 << 20
+
+FORMATS = ("text", "csv", "jsonl", "arrow")
+
+
+def literal_sql(stmt, dialect) -> str:
+    """SQL text with bound values inlined, for statements that take no bind
+    parameters (COPY, EXPLAIN)
+    """
+    return str(stmt.compile(dialect=dialect,
+                            compile_kwargs={"literal_binds": True}))
+
+
+class ResultWriter:
+    """Batched, buffered sink for result rows (stdout or a file)
+
+    Text format: every row is '%'-formatted with the caller's FMT.
+    """
+    format = "text"
+    binary = False
+
+    def __init__(self, path: str | None = None,
+                 batch_size: int = BATCH_SIZE,
+                 buffer_size: int = BUFFER_SIZE,
+                 file=None, drain=None):
+        self.batch_size = batch_size
+        self.path = path
+        self.waiter = drain
+        mode = "wb" if self.binary else "w"
+        kwargs = {} if self.binary else {"encoding": self.encoding(path),
+                                         "newline": ""}
+        if file is not None:
+            self.file = file
+        elif path is None or path == "-":
+            self.file = open(sys.stdout.fileno(), mode,
+                               buffering=buffer_size, closefd=False, **kwargs)
+        else:
+            self.file = open(path, mode, buffering=buffer_size, **kwargs)
+        self.columns = None
+
+    def encoding(self, path: str | None) -> str:
+        if path is None or path == "-":
+            return sys.stdout.encoding or "utf-8"
+        return "utf-8"
+
+    def line(self, text: str) -> None:
+        """Human-readable line (titles, totals): text format only
+        """
+        self.file.write(text + os.linesep)
+
+    def rows(self, fmt: str, rows) -> int:
+        """Write every row formatted with '%'-style FMT, return row count
+        """
+        count = 0
+        it = iter(rows)
+        while batch := list(islice(it, self.batch_size)):
+            self.write_batch(fmt, batch)
+            count += len(batch)
+        return count
+
+    def write_batch(self, fmt: str, batch: list) -> None:
+        self.file.write(os.linesep.join([fmt % tuple(r) for r in batch]))
+        self.file.write(os.linesep)
+
+    async def stream(self, session, stmt, fmt: str,
+                     columns: list | None = None, transform=None) -> int:
+        """Execute STMT on a server-side cursor and write it partition by
+        partition. TRANSFORM maps a partition to the rows to write, COLUMNS
+        then name the transformed fields.
+        """
+        result = await session.stream(stmt)
+        self.columns = columns or list(result.keys())
+        count = 0
+        async for part in result.partitions(self.batch_size):
+            count += self.rows(fmt, transform(part) if transform else part)
+            await self.drain()
+        if uni_metrics.METRICS is not None:
+            uni_metrics.METRICS.streamed((await session.connection()).info,
+                                         count)
+        return count
+
+    async def drain(self) -> None:
+        """Wait while the reader of FILE is behind: DRAIN, an async callable
+        given to the constructor (a daemon's client, see uni_daemon.py)
+        """
+        if self.waiter is not None:
+            await self.waiter()
+
+    def buffered(self) -> "ResultWriter":
+        """Writer of the same format into memory, for a result that is
+        produced concurrently with others and append()-ed in order later
+        """
+        raw = io.BytesIO()
+        if self.binary:
+            return type(self)(batch_size=self.batch_size, file=raw)
+        return type(self)(batch_size=self.batch_size, file=io.TextIOWrapper(
+            raw, encoding=self.file.encoding, newline=""))
+
+    def getvalue(self) -> bytes:
+        """What a buffered() writer holds
+        """
+        self.flush()
+        return (self.file if self.binary else self.file.buffer).getvalue()
+
+    def write_bytes(self, data: bytes) -> None:
+        """Write DATA, already in this writer's format
+        """
+        if self.binary:
+            self.file.write(data)
+        else:
+            self.file.flush()
+            self.file.buffer.write(data)
+
+    def append(self, other: "ResultWriter") -> None:
+        """Write out what the buffered() writer OTHER holds
+        """
+        self.write_bytes(other.getvalue())
+
+    def flush(self) -> None:
+        # whatever print() left in sys.stdout must go out first
+        sys.stdout.flush()
+        self.file.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CsvWriter(ResultWriter):
+    """CSV with a header line per result set
+    """
+    format = "csv"
+
+    def __init__(self, *args, copy: bool = True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.copy = copy
+        self.csv = csv.writer(self.file, lineterminator=os.linesep)
+        self.header_done = False
+
+    def encoding(self, path: str | None) -> str:
+        # COPY output is written to the byte stream as UTF-8
+        return "utf-8"
+
+    def line(self, text: str) -> None:
+        pass
+
+    def write_batch(self, fmt: str, batch: list) -> None:
+        if not self.header_done:
+            self.csv.writerow(self.columns or [])
+            self.header_done = True
+        self.csv.writerows(batch)
+
+    async def stream(self, session, stmt, fmt: str,
+                     columns: list | None = None, transform=None) -> int:
+        if not self.copy or transform is not None:
+            self.header_done = False
+            return await super().stream(session, stmt, fmt, columns, transform)
+
+        # Fast path: the server renders CSV itself, rows never become Python
+        # objects.
+        conn = await session.connection()
+        sql = literal_sql(stmt, conn.dialect)
+        raw = await conn.get_raw_connection()
+        self.file.flush()
+
+        async def sink(data: bytes) -> None:
+            self.file.buffer.write(data)
+            await self.drain()
+
+        status = await raw.driver_connection.copy_from_query(
+            sql, output=sink, format="csv", header=True)
+        self.file.buffer.flush()
+        return int(status.split()[-1])
+
+
+class JsonlWriter(ResultWriter):
+    """One JSON object per row, keyed by column name
+    """
+    format = "jsonl"
+
+    def encoding(self, path: str | None) -> str:
+        return "utf-8"
+
+    def line(self, text: str) -> None:
+        pass
+
+    def write_batch(self, fmt: str, batch: list) -> None:
+        columns = self.columns
+        self.file.write("".join([
+            json.dumps(dict(zip(columns, r)), ensure_ascii=False, default=str)
+            + os.linesep for r in batch ]))
+
+
+class ArrowWriter(ResultWriter):
+    """Arrow IPC stream, one record batch per partition (needs pyarrow)
+    """
+    format = "arrow"
+    binary = True
+
+    def __init__(self, *args, **kwargs):
+        try:
+            import pyarrow
+        except ImportError:
+            raise SystemExit("--format arrow needs pyarrow: pip install pyarrow")
+        self.pa = pyarrow
+        super().__init__(*args, **kwargs)
+        self.writer, self.schema = None, None
+
+    def line(self, text: str) -> None:
+        pass
+
+    def write_batch(self, fmt: str, batch: list) -> None:
+        pa = self.pa
+        arrays = [ pa.array(list(col)) for col in zip(*batch) ]
+        if self.writer is None:
+            rb = pa.RecordBatch.from_arrays(arrays, names=self.columns)
+            self.schema = rb.schema
+            self.writer = pa.ipc.new_stream(self.file, self.schema)
+        else:
+            rb = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        self.writer.write_batch(rb)
+
+    def end_stream(self) -> None:
+        if self.writer is None and self.columns is not None:
+            # empty result still carries its schema
+            self.schema = self.pa.schema([ (c, self.pa.null())
+                                           for c in self.columns ])
+            self.writer = self.pa.ipc.new_stream(self.file, self.schema)
+        if self.writer is not None:
+            self.writer.close()
+        self.writer, self.schema, self.columns = None, None, None
+
+    async def stream(self, session, stmt, fmt: str,
+                     columns: list | None = None, transform=None) -> int:
+        # every result set is its own IPC stream, written back to back
+        self.end_stream()
+        count = await super().stream(session, stmt, fmt, columns, transform)
+        self.end_stream()
+        return count
+
+    def close(self) -> None:
+        self.end_stream()
+        super().close()
+
+
+WRITERS = { w.format: w for w in (ResultWriter, CsvWriter, JsonlWriter, ArrowWriter) }
+
+
+def open_writer(fmt: str = "text", path: str | None = None,
+                explain: str | None = None, label: str = "plan",
+                file=None, drain=None) -> ResultWriter:
+    if explain:
+        from uni_explain import ExplainWriter
+        return ExplainWriter(explain, label, path=path, file=file, drain=drain)
+    return WRITERS[fmt](path, file=file, drain=drain)
+
+
+def add_output_options(parser) -> None:
+    parser.add_argument("--format", choices=FORMATS, default="text",
+                        help="Output format of result rows (default: text)")
+    parser.add_argument("--out", metavar="FILE", default=None,
+                        help="Write result rows to FILE instead of stdout")
+    parser.add_argument("--explain", metavar="DIR", default=None,
+                        help="Do not print rows: store EXPLAIN (ANALYZE, "
+                             "BUFFERS, FORMAT JSON) of every read into DIR")
+
+
+def diagnostics_logger(fmt: str = "text", path: str | None = None) -> Logger:
+    """Logger for diagnostics. Machine-readable rows on stdout must not be
+    interleaved with it, so then it goes to stderr.
+    """
+    if fmt == "text" or (path is not None and path != "-"):
+        return Logger.with_default_handlers(name='NoPrintLogger')
+    logger = Logger(name='NoPrintLogger')
+    logger.add_handler(AsyncStreamHandler(stream=sys.stderr, level=LogLevel.DEBUG))
+    return logger
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+from contextvars import ContextVar
+import functools
+from pathlib import Path
+import sys
+import time
+
+# --profile MODE of seed.py and the uni-select-??.py reports; the run goes
+# under a profiler and its report to --profile-out FILE
+# (default <entry point>.<MODE>.prof|txt):
+#
+#   cpu     cProfile. FILE holds the pstats dump (python -m pstats FILE,
+#           snakeviz FILE), FILE.txt the functions by cumulative time.
+#   alloc   tracemalloc: peak and current traced memory, the lines that
+#           allocated most.
+#   async   wall time of awaited calls, by kind: the database calls of
+#           AsyncSession / AsyncConnection and the row partitions of a
+#           streamed result ("db"), option handlers ("option"), logger
+#           writes ("logger") and the whole run ("main"). Self time is what
+#           a call spent outside the timed calls it awaited.
+#
+# Together with [ DEBUG ] METRICS (server-side statement time, see
+# uni_metrics.py) that splits a slow run between Python, the driver and the
+# server. cProfile and tracemalloc are imported only when asked for.
+
+MODES = ("cpu", "alloc", "async")
+SUFFIXES = {"cpu": ".prof", "alloc": ".txt", "async": ".txt"}
+TOP = 40                # lines of a text report
+
+# awaited database calls the async mode times, per class
+DB_CALLS = {
+    "AsyncSession": ("execute", "scalars", "scalar", "stream", "get",
+                     "flush", "commit", "rollback", "connection"),
+    "AsyncConnection": ("execute", "exec_driver_sql", "stream", "scalars",
+                        "scalar", "commit", "rollback", "get_raw_connection"),
+}
+LOGGER_CALLS = ("debug", "info", "warning", "error")
+
+_frames = ContextVar("uni_profile_frames", default=())
+
+
+def add_profile_options(parser) -> None:
+    parser.add_argument("--profile", choices=MODES, default=None,
+                        help="Run under a profiler: cpu (cProfile), alloc "
+                             "(tracemalloc) or async (wall time of awaited "
+                             "DB calls, option handlers, logger writes)")
+    parser.add_argument("--profile-out", metavar="FILE", default=None,
+                        help="Profile report file (default: "
+                             "<entry point>.<MODE>.prof|txt)")
+
+
+class Timing:
+    """Wall time of one awaited call, added to ENTRY [calls, total, self,
+    max] on exit and to the child time of the enclosing timed call
+    """
+    def __init__(self, entry: list):
+        self.entry = entry
+
+    def __enter__(self):
+        self.parent = _frames.get()
+        self.children = [0.0]
+        self.token = _frames.set(self.parent + (self.children,))
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        _frames.reset(self.token)
+        if self.parent:
+            self.parent[-1][0] += elapsed
+        entry = self.entry
+        entry[0] += 1
+        entry[1] += elapsed
+        # concurrent children may overlap: self time is not < 0
+        entry[2] += max(elapsed - self.children[0], 0.0)
+        entry[3] = max(entry[3], elapsed)
+
+
+class Profiler:
+    """Context manager around one run of an entry point; writes its report
+    on exit
+    """
+    def __init__(self, mode: str, path: str, name: str = "main"):
+        self.mode = mode
+        self.path = Path(path)
+        self.name = name
+        self.stats = {}         # (kind, name) -> [calls, total, self, max]
+        self.patched = []
+        self.profile = None
+
+    # async mode: timing of awaited calls
+
+    def timing(self, key: tuple) -> "Timing":
+        return Timing(self.stats.setdefault(key, [0, 0.0, 0.0, 0.0]))
+
+    def timed(self, fn, kind: str, name: str):
+        """FN, an async function or one returning an awaitable, timed as
+        (KIND, NAME) in async mode
+        """
+        if self.mode != "async":
+            return fn
+        key = (kind, name)
+
+        @functools.wraps(fn)
+        async def timed_call(*args, **kwargs):
+            with self.timing(key):
+                return await fn(*args, **kwargs)
+
+        return timed_call
+
+    def timed_iter(self, fn, kind: str, name: str):
+        """FN, an async generator function: the time to get each item
+        """
+        key = (kind, name)
+
+        @functools.wraps(fn)
+        async def timed_gen(*args, **kwargs):
+            items = fn(*args, **kwargs)
+            while True:
+                with self.timing(key):
+                    try:
+                        item = await items.__anext__()
+                    except StopAsyncIteration:
+                        return
+                yield item
+
+        return timed_gen
+
+    def watch(self, kind: str, owner, names, label: str | None = None,
+              iterate: bool = False) -> None:
+        """Time OWNER.NAME for every name of NAMES (async mode); undone on
+        exit
+        """
+        if self.mode != "async":
+            return
+        label = label or getattr(owner, "__name__", type(owner).__name__)
+        wrap = self.timed_iter if iterate else self.timed
+        for name in names:
+            fn = getattr(owner, name)
+            self.patched.append((owner, name, name in vars(owner), fn))
+            setattr(owner, name, wrap(fn, kind, f"{label}.{name}"))
+
+    def main(self, main):
+        """The coroutine MAIN, timed as the whole run
+        """
+        if self.mode != "async":
+            return main
+
+        async def timed_main():
+            with self.timing(("main", self.name)):
+                return await main
+
+        return timed_main()
+
+    # start / stop / report
+
+    def __enter__(self):
+        if self.mode == "cpu":
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        elif self.mode == "alloc":
+            import tracemalloc
+            tracemalloc.start(10)
+        else:
+            from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+            from sqlalchemy.ext.asyncio import AsyncResult
+            for cls in (AsyncSession, AsyncConnection):
+                self.watch("db", cls, DB_CALLS[cls.__name__])
+            self.watch("db", AsyncResult, ("partitions",), iterate=True)
+        return self
+
+    def __exit__(self, *exc):
+        if self.mode == "cpu":
+            self.profile.disable()
+            self.write_cpu()
+        elif self.mode == "alloc":
+            self.write_alloc()
+        else:
+            for owner, name, own, fn in reversed(self.patched):
+                if own:
+                    setattr(owner, name, fn)
+                else:
+                    delattr(owner, name)
+            self.write_async()
+        print(f"Profile ({self.mode}) written to '{self.path}'",
+              file=sys.stderr)
+
+    def write_cpu(self) -> None:
+        import pstats
+        self.profile.dump_stats(self.path)
+        with open(f"{self.path}.txt", "w", encoding="utf-8") as f:
+            pstats.Stats(self.profile, stream=f) \
+                .sort_stats("cumulative").print_stats(TOP)
+
+    def write_alloc(self) -> None:
+        import tracemalloc
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")))
+        tracemalloc.stop()
+        with open(self.path, "w", encoding="utf-8") as f:
+            print(f"Peak traced memory {peak / 1024:.1f} KiB, "
+                  f"at exit {current / 1024:.1f} KiB", file=f)
+            print(f"Top {TOP} allocating lines (live at exit):", file=f)
+            for stat in snapshot.statistics("lineno")[:TOP]:
+                print(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks"
+                      f"  {stat.traceback}", file=f)
+
+    def write_async(self) -> None:
+        with open(self.path, "w", encoding="utf-8") as f:
+            print("%-7s %-38s %8s %10s %10s %10s" % (
+                "kind", "awaited", "calls", "total ms", "self ms", "max ms"),
+                file=f)
+            for (kind, name), (calls, total, own, top) in sorted(
+                    self.stats.items(), key=lambda item: -item[1][1]):
+                print("%-7s %-38s %8d %10.1f %10.1f %10.1f" % (
+                    kind, name, calls, total * 1000, own * 1000, top * 1000),
+                    file=f)
+
+
+def profiler(args, name: str, logger=None) -> Profiler | None:
+    """Profiler of --profile / --profile-out of ARGS for the entry point
+    NAME, or None; in async mode LOGGER's writes are timed too
+    """
+    if args.profile is None:
+        return None
+    path = args.profile_out or f"{name}.{args.profile}{SUFFIXES[args.profile]}"
+    profile = Profiler(args.profile, path, name)
+    if logger is not None:
+        profile.watch("logger", logger, LOGGER_CALLS, "logger")
+    return profile
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import base64
+from collections import OrderedDict
+import json
+import time
+
+from sqlalchemy import Integer, bindparam, event, tuple_
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+
+# Statements are built once, as module-level templates with bindparam()
+# placeholders, and executed as TEMPLATE.params(...). Every call then has
+# the same cache key and SQLAlchemy compiles the SQL only the first time.
+# str(stmt) for the log is a compilation of its own, outside that cache:
+# sql_text() does it once per template.
+
+_sql_text = {}
+
+
+def sql_text(stmt) -> str:
+    """str(STMT), computed once per statement template
+    """
+    try:
+        return _sql_text[stmt]
+    except KeyError:
+        text = _sql_text[stmt] = str(stmt)
+        return text
+
+
+_pages = {}
+
+
+def keyset_page(stmt, key, id_col, after: bool = False):
+    """STMT as one page of keyset pagination: ordered by (KEY, ID_COL), at
+    most :limit rows and, with AFTER, only the rows past (:after_key,
+    :after_id). There is no OFFSET, so a deep page costs what the first one
+    does when (KEY, ID_COL) is indexed. Built once per template.
+    """
+    try:
+        return _pages[stmt, after]
+    except KeyError:
+        page = stmt.order_by(key, id_col) \
+                .limit(bindparam("limit", type_=Integer))
+        if after:
+            page = page.where(tuple_(key, id_col) > tuple_(
+                bindparam("after_key", type_=key.type),
+                bindparam("after_id", type_=id_col.type)))
+        _pages[stmt, after] = page
+        return page
+
+
+def encode_cursor(opt: str, key, found_id: int) -> str:
+    """Opaque --after value: the option and the (key, id) of its last row
+    """
+    raw = json.dumps([opt, key, found_id], ensure_ascii=False, default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """encode_cursor() -> (opt, key, id); ValueError when it is not one
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        opt, key, found_id = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"not a cursor: {cursor!r}") from e
+    if not isinstance(found_id, int):
+        raise ValueError(f"not a cursor: {cursor!r}")
+    return opt, key, found_id
+
+
+class CompileStats:
+    """Compiled-SQL cache statistics of an engine
+    """
+    def __init__(self, engine):
+        self.hits = self.compiles = self.uncached = 0
+        event.listen(engine.sync_engine, "before_cursor_execute",
+                     self.before_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        cache_hit = getattr(context, "cache_hit", None)
+        if cache_hit is CACHE_HIT:
+            self.hits += 1
+        elif cache_hit is CACHE_MISS:
+            self.compiles += 1
+        else:
+            self.uncached += 1      # driver SQL, savepoints, DDL
+
+    def summary(self) -> str:
+        return (f"SQL compiled {self.compiles} time(s), "
+                f"compiled cache hit {self.hits} time(s), "
+                f"{self.uncached} uncached statement(s)")
+
+
+NAME_CACHE_SIZE = 4096
+
+
+class NameCache:
+    """Bounded LRU of (kind, name) -> id, kept in session.info for the
+    lifetime of one invocation. With TTL, a name is looked up again after
+    TTL seconds: a long-lived cache then catches up with changes made by
+    other clients.
+    """
+    def __init__(self, size: int = NAME_CACHE_SIZE, ttl: float | None = None):
+        self.size = size
+        self.ttl = ttl
+        self.ids = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, kind: str, name: str) -> int | None:
+        key = (kind, name)
+        if key not in self.ids or (self.ttl is not None and
+                                   time.monotonic() > self.ids[key][1]):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.ids.move_to_end(key)
+        return self.ids[key][0]
+
+    def put(self, kind: str, name: str, found_id: int) -> None:
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        self.ids[(kind, name)] = (found_id, expires)
+        self.ids.move_to_end((kind, name))
+        if len(self.ids) > self.size:
+            self.ids.popitem(last=False)
+
+    def forget(self, kinds) -> None:
+        """Drop every name of KINDS: they were created, renamed or deleted
+        """
+        for key in [ k for k in self.ids if k[0] in kinds ]:
+            del self.ids[key]
+
+    def summary(self) -> str:
+        return (f"Name cache hit {self.hits} time(s), "
+                f"missed {self.misses} time(s)")
+
+
+class PendingNames:
+    """The names one transaction resolves, kept apart from the NameCache
+    shared with other requests: their ids may be of rows that are not
+    committed yet, or never will be. merge() shares them once the
+    transaction has committed.
+    """
+    def __init__(self, shared: NameCache):
+        self.shared = shared
+        self.ids = {}
+        self.changed = set()    # kinds whose shared names may be stale here
+
+    def get(self, kind: str, name: str) -> int | None:
+        found_id = self.ids.get((kind, name))
+        if found_id is not None:
+            self.shared.hits += 1
+            return found_id
+        if kind in self.changed:
+            self.shared.misses += 1
+            return None
+        return self.shared.get(kind, name)
+
+    def put(self, kind: str, name: str, found_id: int) -> None:
+        self.ids[(kind, name)] = found_id
+
+    def forget(self, kinds) -> None:
+        """This transaction created, renamed or deleted names of KINDS
+        """
+        self.changed.update(kinds)
+        for key in [ k for k in self.ids if k[0] in kinds ]:
+            del self.ids[key]
+
+    def merge(self) -> None:
+        """The transaction committed: share what it resolved and drop the
+        shared names it changed
+        """
+        self.shared.forget(self.changed)
+        for (kind, name), found_id in self.ids.items():
+            self.shared.put(kind, name, found_id)
+        self.ids.clear()
+        self.changed.clear()
+
+
+def name_cache(session) -> NameCache:
+    cache = session.info.get("name_cache")
+    if cache is None:
+        cache = session.info["name_cache"] = NameCache()
+    return cache
+
+
+class TableVersions:
+    """Change counter per table. A write path bumps the tables it changed
+    after its transaction is over; a reader snapshots the counters of its
+    tables before it reads.
+    """
+    def __init__(self):
+        self.versions = {}
+
+    def bump(self, tables) -> None:
+        for table in tables:
+            self.versions[table] = self.versions.get(table, 0) + 1
+
+    def snapshot(self, tables) -> tuple:
+        return tuple(self.versions.get(t, 0) for t in tables)
+
+
+TABLE_VERSIONS = TableVersions()
+
+RESULT_CACHE_SIZE = 64
+RESULT_CACHE_TTL = 300.0
+
+
+class ResultCache:
+    """Bounded LRU of rendered results (bytes) with a TTL. An entry is
+    valid while the versions of the tables it was read from are unchanged.
+    """
+    def __init__(self, versions: TableVersions = TABLE_VERSIONS,
+                 size: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL):
+        self.versions = versions
+        self.size = size
+        self.ttl = ttl
+        self.results = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key, tables) -> bytes | None:
+        entry = self.results.get(key)
+        if entry is None or time.monotonic() > entry[2] \
+                or entry[1] != self.versions.snapshot(tables):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.results.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, snapshot: tuple, data: bytes) -> None:
+        """SNAPSHOT: the versions taken before the result was read
+        """
+        self.results[key] = (data, snapshot, time.monotonic() + self.ttl)
+        self.results.move_to_end(key)
+        if len(self.results) > self.size:
+            self.results.popitem(last=False)
+
+    def summary(self) -> str:
+        return (f"Result cache hit {self.hits} time(s), "
+                f"missed {self.misses} time(s)")
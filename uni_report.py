@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+import argparse
+
+from uni_output import add_output_options
+from uni_profile import add_profile_options
+
+
+def report_parser(description: str) -> argparse.ArgumentParser:
+    """Command line shared by all uni-select-??.py reports
+    """
+    parser = argparse.ArgumentParser(
+        description=description,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_output_options(parser)
+    add_profile_options(parser)
+    return parser
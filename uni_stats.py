@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+from sqlalchemy import ARRAY, String, bindparam, text
+
+# seed.py --stats: database health from the catalog and the statistics
+# views. There is no COUNT(*) and no table scan.
+#
+# Row counts are the planner's pg_class.reltuples estimates as of the last
+# ANALYZE. Sizes come from pg_relation_size() and its kin: they are current,
+# but they take an ACCESS SHARE lock on every table and index. LOCK_TIMEOUT
+# keeps them from queueing behind the ACCESS EXCLUSIVE locks the dashboard
+# is to show: a section that runs into one is skipped. Bloat is estimated
+# from the pg_stats column widths.
+#
+# The scan and tuple counters run since the last statistics reset
+# (STATS_RESET) and are per server, so ask the primary.
+#
+# SECTIONS: (title, statement, row format). The statements take :tables,
+# the table names of the model.
+
+TABLES = bindparam("tables", type_=ARRAY(String))
+
+STATS_RESET = text("""
+SELECT COALESCE(to_char(stats_reset, 'YYYY-MM-DD HH24:MI:SS'), 'never')
+FROM pg_stat_database WHERE datname = current_database()
+""")
+
+# the lock_timeout of the sections; set_config(..., true) is SET LOCAL,
+# which a RELEASE SAVEPOINT keeps: the caller sets the old value back
+LOCK_TIMEOUT = "2s"
+SHOW_LOCK_TIMEOUT = text("SELECT current_setting('lock_timeout')")
+SET_LOCK_TIMEOUT = text("SELECT set_config('lock_timeout', :value, true)")
+
+SIZES = text("""
+WITH sizes AS (
+    SELECT c.relname, c.reltuples,
+           pg_relation_size(c.oid) AS heap,
+           pg_indexes_size(c.oid) AS indexes,
+           COALESCE(pg_total_relation_size(NULLIF(c.reltoastrelid, 0)), 0)
+               AS toast,
+           pg_total_relation_size(c.oid) AS total
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.relkind = 'r' AND n.nspname = current_schema()
+      AND c.relname = ANY(:tables)
+)
+SELECT relname AS "table",
+       CASE WHEN reltuples > 0 THEN reltuples::bigint::text
+            ELSE 'unknown (not analyzed)' END AS est_rows,
+       pg_size_pretty(heap) AS table_size,
+       pg_size_pretty(indexes) AS index_size,
+       pg_size_pretty(toast) AS toast_size,
+       pg_size_pretty(total) AS total_size
+FROM sizes
+ORDER BY total DESC, relname
+""").bindparams(TABLES)
+
+# unique indexes enforce a constraint: never "unused"
+INDEXES = text("""
+SELECT s.relname AS "table", s.indexrelname AS "index",
+       s.idx_scan AS scans, s.idx_tup_read AS tuples_read,
+       pg_size_pretty(pg_relation_size(s.indexrelid)) AS size,
+       CASE WHEN s.idx_scan = 0 AND NOT i.indisunique
+            THEN 'UNUSED' ELSE '' END AS note
+FROM pg_stat_user_indexes s
+JOIN pg_index i ON i.indexrelid = s.indexrelid
+WHERE s.schemaname = current_schema() AND s.relname = ANY(:tables)
+ORDER BY s.relname, s.idx_scan DESC, s.indexrelname
+""").bindparams(TABLES)
+
+# Expected pages: reltuples rows of (tuple header, line pointer, average
+# width) bytes on pages of block_size less the page header, against the
+# pages the table has now. Needs ANALYZE (pg_stats), else it is '-'; the
+# estimate ignores alignment padding and fillfactor.
+VACUUM = text("""
+WITH widths AS (
+    SELECT tablename, SUM(avg_width) AS width
+    FROM pg_stats WHERE schemaname = current_schema()
+    GROUP BY tablename
+), bloat AS (
+    SELECT c.relname,
+           pg_relation_size(c.oid) / current_setting('block_size')::int
+               AS pages,
+           CEIL(c.reltuples * (28 + w.width)
+                / (current_setting('block_size')::int - 24))::bigint
+               AS expected
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN widths w ON w.tablename = c.relname
+    WHERE c.relkind = 'r' AND n.nspname = current_schema()
+      AND c.relname = ANY(:tables) AND c.reltuples >= 0
+)
+SELECT s.relname AS "table", s.n_live_tup AS live, s.n_dead_tup AS dead,
+       round(100.0 * s.n_dead_tup
+             / GREATEST(s.n_live_tup + s.n_dead_tup, 1), 1) AS dead_pct,
+       COALESCE(CASE WHEN b.pages > 0
+                     THEN round(100.0 * GREATEST(b.pages - b.expected, 0)
+                                / b.pages, 1)::text END, '-') AS bloat_pct,
+       COALESCE(to_char(s.last_vacuum, 'YYYY-MM-DD HH24:MI'), '-')
+           AS last_vacuum,
+       COALESCE(to_char(s.last_autovacuum, 'YYYY-MM-DD HH24:MI'), '-')
+           AS last_autovacuum,
+       COALESCE(to_char(s.last_analyze, 'YYYY-MM-DD HH24:MI'), '-')
+           AS last_analyze,
+       COALESCE(to_char(s.last_autoanalyze, 'YYYY-MM-DD HH24:MI'), '-')
+           AS last_autoanalyze
+FROM pg_stat_user_tables s
+LEFT JOIN bloat b ON b.relname = s.relname
+WHERE s.schemaname = current_schema() AND s.relname = ANY(:tables)
+ORDER BY s.n_dead_tup DESC, s.relname
+""").bindparams(TABLES)
+
+# a lock wait may be on any table
+LOCK_WAITS = text("""
+SELECT a.pid,
+       array_to_string(pg_blocking_pids(a.pid), ',') AS blocked_by,
+       a.wait_event AS lock_type,
+       EXTRACT(EPOCH FROM now() - a.query_start)::int AS seconds,
+       left(regexp_replace(a.query, '\\s+', ' ', 'g'), 80) AS query
+FROM pg_stat_activity a
+WHERE a.wait_event_type = 'Lock' AND a.datname = current_database()
+ORDER BY a.query_start
+""")
+
+SECTIONS = (
+    ("Tables: estimated rows and sizes", SIZES,
+     "%-18s %22s %11s %11s %11s %11s"),
+    ("Indexes: scans since the statistics reset", INDEXES,
+     "%-18s %-26s %10s %12s %9s %s"),
+    ("Dead tuples, bloat estimate (%), last (auto)vacuum and (auto)analyze",
+     VACUUM, "%-18s %9s %8s %8s %9s  %-16s %-16s %-16s %-16s"),
+    ("Lock waits", LOCK_WAITS, "%7s %-12s %-14s %7s  %s"),
+)